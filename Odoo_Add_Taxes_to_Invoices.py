@@ -10,6 +10,12 @@
 # Configuration
 TAX_ID = 315
 BATCH_SIZE = 100
+# Posted invoices: 'skip' = leave them untouched, 'repost' = reset to draft, update and post again
+# (paid or partially paid invoices are always skipped: resetting them would undo the reconciliation)
+POSTED_MODE = 'skip'
+
+if POSTED_MODE not in ('skip', 'repost'):
+    raise UserError("POSTED_MODE must be 'skip' or 'repost'.")
 
 # Get selected IDs
 all_eligible_ids = records.ids
@@ -25,35 +31,91 @@ if not tax.exists():
 total_count = len(all_eligible_ids)
 success_count = 0
 updated_lines_count = 0
+skipped_count = 0
+reposted_count = 0
+paid_skipped_count = 0
+failed_count = 0
+
+def update_moves(move_ids, lines_by_move, posted_ids):
+    """Add the tax to the lines of these moves, re-posting the posted ones."""
+    moves_to_repost = env['account.move'].browse([m for m in move_ids if m in posted_ids])
+    if moves_to_repost:
+        moves_to_repost.button_draft()
+    line_ids = []
+    for move_id in move_ids:
+        line_ids.extend(lines_by_move[move_id])
+    # ONE write for all the lines: taxes and totals are recomputed once per move
+    env['account.move.line'].browse(line_ids).write({'tax_ids': [(4, TAX_ID)]})
+    if moves_to_repost:
+        moves_to_repost.action_post()
+    return len(line_ids), len(moves_to_repost)
 
 log(f"Starting batch tax update for {total_count} selected invoices...", level='info')
 
 # Process in chunks
 for i in range(0, total_count, BATCH_SIZE):
     batch_ids = all_eligible_ids[i:i + BATCH_SIZE]
-    
-    # Browse current batch
-    invoice_batch = env['account.move'].browse(batch_ids)
-    
-    batch_updated_invoices = 0
-    for invoice in invoice_batch:
-        # Filter lines that don't already have the tax
-        lines_to_update = invoice.invoice_line_ids.filtered(
-            lambda l: TAX_ID not in l.tax_ids.ids
-        )
-        
-        if lines_to_update:
-            # Add the tax to the lines
-            for line in lines_to_update:
-                line.write({'tax_ids': [(4, TAX_ID)]})
-                updated_lines_count += 1
-            batch_updated_invoices += 1
-    
-    success_count += batch_updated_invoices
-    
+
+    # Move states of the whole batch in one read
+    draft_ids = []
+    posted_ids = []
+    for move in env['account.move'].browse(batch_ids).read(['state', 'payment_state']):
+        if move['state'] == 'draft':
+            draft_ids.append(move['id'])
+        elif move['state'] == 'posted' and POSTED_MODE == 'repost':
+            if move['payment_state'] == 'not_paid':
+                posted_ids.append(move['id'])
+            else:
+                paid_skipped_count += 1
+        else:
+            skipped_count += 1
+
+    # Invoice lines of the batch that don't already have the tax, in one search
+    lines_to_update = env['account.move.line'].search([
+        ('move_id', 'in', draft_ids + posted_ids),
+        ('display_type', '=', 'product'),
+        ('tax_ids', 'not in', [TAX_ID]),
+    ])
+    lines_by_move = {}
+    for line in lines_to_update:
+        lines_by_move.setdefault(line.move_id.id, []).append(line.id)
+    changed_move_ids = list(lines_by_move.keys())
+
+    if changed_move_ids:
+        # Avoid 'with' as it's often restricted (forbidden opcodes)
+        # Use manual savepoints via SQL to protect the transaction
+        try:
+            env.cr.execute("SAVEPOINT add_taxes_batch")
+            line_count, repost_count = update_moves(changed_move_ids, lines_by_move, posted_ids)
+            env.flush_all()
+            env.cr.execute("RELEASE SAVEPOINT add_taxes_batch")
+            updated_lines_count += line_count
+            success_count += len(changed_move_ids)
+            reposted_count += repost_count
+        except Exception as e:
+            env.cr.execute("ROLLBACK TO SAVEPOINT add_taxes_batch")
+            env.invalidate_all()
+            log("Batch tax update failed, falling back to individual invoices: %s" % str(e), level='warning')
+
+            # Fallback: invoice by invoice so one bad invoice does not block the batch
+            for move_id in changed_move_ids:
+                try:
+                    env.cr.execute("SAVEPOINT add_taxes_move")
+                    line_count, repost_count = update_moves([move_id], lines_by_move, posted_ids)
+                    env.flush_all()
+                    env.cr.execute("RELEASE SAVEPOINT add_taxes_move")
+                    updated_lines_count += line_count
+                    success_count += 1
+                    reposted_count += repost_count
+                except Exception as ex:
+                    env.cr.execute("ROLLBACK TO SAVEPOINT add_taxes_move")
+                    env.invalidate_all()
+                    log("Error adding tax to Invoice %s: %s" % (env['account.move'].browse(move_id).name, str(ex)), level='error')
+                    failed_count += 1
+
     # Commit to free up database locks
     env.cr.commit()
-    
+
     # Notification for each batch
     progress = min(i + BATCH_SIZE, total_count)
     env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
@@ -66,6 +128,14 @@ for i in range(0, total_count, BATCH_SIZE):
 # Final summary notification
 message = f"✅ {success_count} invoices updated"
 message += f"\n💎 {updated_lines_count} lines modified"
+if reposted_count:
+    message += f"\n🔁 {reposted_count} posted invoices reset to draft and re-posted"
+if skipped_count:
+    message += f"\n⏭️ {skipped_count} invoices skipped (posted or cancelled)"
+if paid_skipped_count:
+    message += f"\n💰 {paid_skipped_count} paid or partially paid invoices skipped (not re-posted)"
+if failed_count:
+    message += f"\n❌ {failed_count} invoices failed"
 
 action = {
     'type': 'ir.actions.client',
@@ -73,11 +143,12 @@ action = {
     'params': {
         'title': 'Batch Tax Update Complete',
         'message': f"Processed {total_count} selected invoices.\n{message}",
-        'type': 'success',
+        'type': 'success' if not failed_count else 'warning',
         'sticky': True
     }
 }
 
 ## Optimized for Selected Records
+## One Grouped Write per Batch
 ## Real-time Batch Notifications via Bus
 ## Powered By HSx Tech - Ali Muzafar
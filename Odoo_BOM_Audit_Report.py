@@ -1,18 +1,56 @@
 # Odoo Server Action: Advanced BOM Quality Audit (Duplicates & Multiple BOMs)
 # 1. Flags duplicate component entries inside single BOMs.
-# 2. Flags Products that have more than one active BOM.
-# 3. Creates a Detailed Summary Activity for the User.
+# 2. Flags Products that have more than one active BOM (per company and BOM type).
+# 3. Flags archived components and zero-quantity lines.
+# 4. Flags BOMs of different products that are identical (or nearly identical),
+#    candidates to become kits or templates.
+# 5. Creates a Detailed Summary Activity for the User.
 # Part of HSx TECH BOM Cleanup Tools - Powered by Ali Muzafar
+#
+# All checks run as GROUP BY / HAVING queries on ids (selected BOMs or the whole
+# database), so products sharing a display name never collide. Names are only
+# resolved for the offending rows, in one batched read per model.
+#
+# Variant-aware duplicates:
+# On template BoMs whose lines use "Apply on Variants", a component only counts as
+# duplicated when one variant gets it twice. Each BoM is expanded per distinct
+# attribute combination (computed once in SQL and shared by its variants).
+#
+# Incremental Mode:
+# A compact fingerprint is stored per BOM (md5 of the finished-good key, the BOM
+# write_date and its sorted (component, qty, uom, component active, line write_date)
+# line tuples; for template BOMs expanded per variant, also the template's active
+# variant ids and their latest write_date).
+# Only BOMs whose fingerprint changed are re-checked; their findings replace the
+# stored ones and the report is built from the merged, stored findings.
 
 # ── Configuration ────────────────────────────────────────────────────────────
-BATCH_SIZE = 50
+# 'selection' = selected BOMs only, 'database' = every active BOM (no selection needed)
+SCOPE = 'selection'
+# Max rows listed per section in the activity note (counts are always complete)
+MAX_REPORT_ROWS = 500
+# Re-check only BOMs whose fingerprint changed since the previous run
+INCREMENTAL = False
+# Identical BOMs across different finished goods (hash of the normalized line multiset)
+CHECK_IDENTICAL_BOMS = True
+# Near-duplicate BOMs: minimum Jaccard similarity of the component sets (0 = disabled).
+# Uses MinHash + banding, so BOMs are never compared pairwise across the whole set.
+NEAR_DUPLICATE_THRESHOLD = 0.0
+MINHASH_PERMUTATIONS = 32
+MINHASH_BANDS = 8
+# Buckets larger than this are skipped (usually exact clones, already reported above)
+MAX_BUCKET_SIZE = 50
+# Per-variant duplicate check on template BoMs with "Apply on Variants" lines
+CHECK_VARIANT_DUPLICATES = True
+# BoMs expanded per query (bounds memory on templates with many variants)
+VARIANT_EXPANSION_BATCH = 200
 # ─────────────────────────────────────────────────────────────────────────────
 
 # Local Registry setup
 active_ids = env.context.get('active_ids', [])
-records = env['mrp.bom'].browse(active_ids)
+database_scope = SCOPE == 'database'
 
-if not records:
+if not active_ids and not database_scope:
     action = {
         'type': 'ir.actions.client',
         'tag': 'display_notification',
@@ -24,103 +62,480 @@ if not records:
         }
     }
 else:
-    total_records = len(records)
-    
-    # Audit tracking
-    # {variant_display_name: {bom_name: {component_name: count}}}
-    variant_audit_map = {}
-    duplicate_line_total = 0
-
-    for i in range(0, total_records, BATCH_SIZE):
-        batch = records[i:i + BATCH_SIZE]
-        
-        for bom in batch:
-            # Resolve Finished Good Name
-            fg_name = bom.product_id.display_name if bom.product_id else bom.product_tmpl_id.display_name
-            
-            if fg_name not in variant_audit_map:
-                variant_audit_map[fg_name] = {'boms': [], 'duplicates': {}}
-            
-            variant_audit_map[fg_name]['boms'].append(bom.display_name)
-
-            # Audit Part 2: Duplicate Product entries inside this specific BOM
-            line_counts = {}
-            for line in bom.bom_line_ids:
-                p_name = line.product_id.display_name
-                line_counts[p_name] = line_counts.get(p_name, 0) + 1
-            
-            # Filter for duplicates
-            dupes = {p: c for p, c in line_counts.items() if c > 1}
-            if dupes:
-                variant_audit_map[fg_name]['duplicates'][bom.display_name] = dupes
-                duplicate_line_total += sum(dupes.values()) - len(dupes)
-
-        # UI Progress
-        progress = min(i + BATCH_SIZE, total_records)
-        env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
-            'title': 'Audit Progress', 'message': f'Audited {progress}/{total_records} BOMs...', 'type': 'info'
-        })
+    if database_scope:
+        bom_filter = "b.active"
+        params = ()
+    else:
+        bom_filter = "b.id = ANY(%s)"
+        params = (list(active_ids),)
+
+    # ── Audit Part 1: Multiple BOMs for the same Finished Good ───────────────
+    # Finished good key = (template, variant); a template-level BOM has no variant.
+    # BOMs of another company or BOM type (kit, subcontracting) are not duplicates,
+    # like in Odoo_Batch_Archive_Duplicate_BoMs.py.
+    env.cr.execute(f"""
+        SELECT b.product_tmpl_id, b.product_id, array_agg(b.id ORDER BY b.sequence, b.id)
+          FROM mrp_bom b
+         WHERE {bom_filter}
+         GROUP BY b.product_tmpl_id, b.product_id, b.company_id, b.type
+        HAVING count(*) > 1
+    """, params)
+    multi_bom_rows = env.cr.fetchall()
+
+    # ── Audit Part 2: Component checks, one pass over mrp_bom_line ───────────
+    def expand_variant_boms(bom_ids):
+        """Per-variant view of template BoMs using "Apply on Variants" lines.
+
+        Returns {bom_id: [(line_ids, variant_count)]}, one entry per distinct set of
+        lines a variant actually gets. Variants are grouped in SQL by their values on
+        the attributes the BoM's lines filter on, so each combination is expanded once
+        and shared by all its variants (nothing is kept per variant).
+        """
+        env.cr.execute("""
+            SELECT l.bom_id, l.id, v.attribute_id, v.id
+              FROM mrp_bom_line l
+              JOIN mrp_bom b ON b.id = l.bom_id
+              JOIN mrp_bom_line_product_template_attribute_value_rel r ON r.mrp_bom_line_id = l.id
+              JOIN product_template_attribute_value v ON v.id = r.product_template_attribute_value_id
+              JOIN product_attribute a ON a.id = v.attribute_id AND a.create_variant != 'no_variant'
+             WHERE l.bom_id = ANY(%s) AND b.product_id IS NULL
+        """, (list(bom_ids),))
+        line_filters = {}
+        expanded_ids = set()
+        for bom_id, line_id, attribute_id, ptav_id in env.cr.fetchall():
+            line_filters.setdefault(line_id, {}).setdefault(attribute_id, set()).add(ptav_id)
+            expanded_ids.add(bom_id)
+        if not expanded_ids:
+            return {}
+        expanded_ids = list(expanded_ids)
+
+        env.cr.execute("SELECT bom_id, id FROM mrp_bom_line WHERE bom_id = ANY(%s) ORDER BY bom_id, sequence, id", (expanded_ids,))
+        lines_by_bom = {}
+        for bom_id, line_id in env.cr.fetchall():
+            lines_by_bom.setdefault(bom_id, []).append(line_id)
+
+        # Distinct variant combinations per BoM, restricted to the attributes its lines use
+        env.cr.execute("""
+            WITH bom_attribute AS (
+                SELECT DISTINCT l.bom_id, v.attribute_id
+                  FROM mrp_bom_line l
+                  JOIN mrp_bom_line_product_template_attribute_value_rel r ON r.mrp_bom_line_id = l.id
+                  JOIN product_template_attribute_value v ON v.id = r.product_template_attribute_value_id
+                 WHERE l.bom_id = ANY(%s)
+            ), variant_combination AS (
+                SELECT b.id AS bom_id, pp.id AS variant_id,
+                       array_agg(v.id ORDER BY v.id) FILTER (WHERE v.id IS NOT NULL) AS combination
+                  FROM mrp_bom b
+                  JOIN product_product pp ON pp.product_tmpl_id = b.product_tmpl_id AND pp.active
+                  LEFT JOIN product_variant_combination c ON c.product_product_id = pp.id
+                  LEFT JOIN product_template_attribute_value v ON v.id = c.product_template_attribute_value_id
+                       AND EXISTS (SELECT 1 FROM bom_attribute ba WHERE ba.bom_id = b.id AND ba.attribute_id = v.attribute_id)
+                 WHERE b.id = ANY(%s)
+                 GROUP BY b.id, pp.id
+            )
+            SELECT bom_id, combination, count(*)
+              FROM variant_combination
+             GROUP BY bom_id, combination
+        """, (expanded_ids, expanded_ids))
+
+        variant_sets = {}
+        for bom_id, combination, variant_count in env.cr.fetchall():
+            values = set(combination or [])
+            # A line applies when the variant has one of its values for every filtered attribute
+            line_ids = tuple(l for l in lines_by_bom.get(bom_id, [])
+                             if all(values & ptav_ids for ptav_ids in line_filters.get(l, {}).values()))
+            # Combinations giving the same lines share one entry
+            sets = variant_sets.setdefault(bom_id, {})
+            sets[line_ids] = sets.get(line_ids, 0) + variant_count
+        return {bom_id: list(sets.items()) for bom_id, sets in variant_sets.items()}
+
+    # Per (bom, component): duplicates, archived component, zero quantity
+    # (zero = below half of the UoM rounding, e.g. 0.0000001 Units).
+    def component_check_rows(where, where_params):
+        env.cr.execute(f"""
+            SELECT l.bom_id, l.product_id,
+                   count(*) AS line_count,
+                   bool_or(NOT p.active) AS archived,
+                   count(*) FILTER (WHERE abs(l.product_qty) < u.rounding / 2) AS zero_qty_count
+              FROM mrp_bom_line l
+              JOIN mrp_bom b ON b.id = l.bom_id
+              JOIN product_product p ON p.id = l.product_id
+              JOIN uom_uom u ON u.id = l.product_uom_id
+             WHERE {where}
+             GROUP BY l.bom_id, l.product_id
+            HAVING count(*) > 1
+                OR bool_or(NOT p.active)
+                OR bool_or(abs(l.product_qty) < u.rounding / 2)
+             ORDER BY l.bom_id, l.product_id
+        """, where_params)
+        rows = env.cr.fetchall()
+        if not CHECK_VARIANT_DUPLICATES:
+            return rows
+
+        # Flat duplicates on variant-specific BoMs: recount per variant line set
+        dup_bom_ids = list(set(r[0] for r in rows if r[2] > 1))
+        expanded_bom_ids = set()
+        variant_counts = {}
+        for i in range(0, len(dup_bom_ids), VARIANT_EXPANSION_BATCH):
+            variant_boms = expand_variant_boms(dup_bom_ids[i:i + VARIANT_EXPANSION_BATCH])
+            if not variant_boms:
+                continue
+            env.cr.execute("SELECT id, product_id FROM mrp_bom_line WHERE bom_id = ANY(%s)", (list(variant_boms.keys()),))
+            line_product = dict(env.cr.fetchall())
+            for bom_id, variant_sets in variant_boms.items():
+                expanded_bom_ids.add(bom_id)
+                for line_ids, variant_count in variant_sets:
+                    counts = {}
+                    for l in line_ids:
+                        counts[line_product[l]] = counts.get(line_product[l], 0) + 1
+                    for product_id, count in counts.items():
+                        key = (bom_id, product_id)
+                        variant_counts[key] = max(variant_counts.get(key, 0), count)
+
+        result = []
+        for bom_id, product_id, line_count, archived, zero_qty_count in rows:
+            if bom_id in expanded_bom_ids:
+                line_count = max(variant_counts.get((bom_id, product_id), 0), 1)
+                if line_count < 2 and not archived and not zero_qty_count:
+                    continue
+            result.append((bom_id, product_id, line_count, archived, zero_qty_count))
+        return result
+
+    rechecked_count = None
+    if INCREMENTAL:
+        env.cr.execute("""
+            CREATE TABLE IF NOT EXISTS hsx_bom_audit_fingerprint (
+                bom_id integer PRIMARY KEY,
+                fingerprint varchar(32) NOT NULL
+            )
+        """)
+        env.cr.execute("""
+            CREATE TABLE IF NOT EXISTS hsx_bom_audit_finding (
+                bom_id integer NOT NULL,
+                product_id integer NOT NULL,
+                line_count integer NOT NULL,
+                archived boolean NOT NULL,
+                zero_qty_count integer NOT NULL
+            )
+        """)
+        env.cr.execute("CREATE INDEX IF NOT EXISTS hsx_bom_audit_finding_bom_idx ON hsx_bom_audit_finding (bom_id)")
+
+        # Fingerprints of the BOMs in scope that are new or changed since the last run.
+        # Template BOMs expanded per variant also cover the template's active variants.
+        env.cr.execute(f"""
+            WITH current_fp AS (
+                SELECT b.id AS bom_id,
+                       md5(concat_ws('|', b.product_tmpl_id, b.product_id, b.write_date,
+                           string_agg(concat_ws(':', l.product_id, l.product_qty, l.product_uom_id, p.active, l.write_date), ','
+                                      ORDER BY l.product_id, l.product_qty, l.product_uom_id, l.id),
+                           CASE WHEN b.product_id IS NULL AND EXISTS (
+                                    SELECT 1 FROM mrp_bom_line vl
+                                      JOIN mrp_bom_line_product_template_attribute_value_rel r ON r.mrp_bom_line_id = vl.id
+                                     WHERE vl.bom_id = b.id)
+                                THEN (SELECT concat_ws(':', string_agg(pp.id::text, '.' ORDER BY pp.id), max(pp.write_date))
+                                        FROM product_product pp
+                                       WHERE pp.product_tmpl_id = b.product_tmpl_id AND pp.active)
+                           END)) AS fingerprint
+                  FROM mrp_bom b
+                  LEFT JOIN mrp_bom_line l ON l.bom_id = b.id
+                  LEFT JOIN product_product p ON p.id = l.product_id
+                 WHERE {bom_filter}
+                 GROUP BY b.id
+            )
+            SELECT c.bom_id, c.fingerprint
+              FROM current_fp c
+              LEFT JOIN hsx_bom_audit_fingerprint s ON s.bom_id = c.bom_id
+             WHERE s.fingerprint IS DISTINCT FROM c.fingerprint
+        """, params)
+        changed = env.cr.fetchall()
+        changed_ids = [r[0] for r in changed]
+        rechecked_count = len(changed_ids)
+
+        if database_scope:
+            # Forget BOMs that were archived or deleted since the last run
+            env.cr.execute("DELETE FROM hsx_bom_audit_fingerprint s WHERE NOT EXISTS (SELECT 1 FROM mrp_bom b WHERE b.id = s.bom_id AND b.active)")
+            env.cr.execute("DELETE FROM hsx_bom_audit_finding f WHERE NOT EXISTS (SELECT 1 FROM mrp_bom b WHERE b.id = f.bom_id AND b.active)")
+
+        if changed_ids:
+            # Merge: findings of changed BOMs replace the stored ones
+            env.cr.execute("DELETE FROM hsx_bom_audit_finding WHERE bom_id = ANY(%s)", (changed_ids,))
+            for row in component_check_rows("b.id = ANY(%s)", (changed_ids,)):
+                env.cr.execute("""
+                    INSERT INTO hsx_bom_audit_finding (bom_id, product_id, line_count, archived, zero_qty_count)
+                    VALUES (%s, %s, %s, %s, %s)
+                """, row)
+            for bom_id, fingerprint in changed:
+                env.cr.execute("""
+                    INSERT INTO hsx_bom_audit_fingerprint (bom_id, fingerprint) VALUES (%s, %s)
+                    ON CONFLICT (bom_id) DO UPDATE SET fingerprint = EXCLUDED.fingerprint
+                """, (bom_id, fingerprint))
+        env.cr.commit()
+
+        # Report from the merged, stored findings of the BOMs in scope
+        env.cr.execute(f"""
+            SELECT f.bom_id, f.product_id, f.line_count, f.archived, f.zero_qty_count
+              FROM hsx_bom_audit_finding f
+              JOIN mrp_bom b ON b.id = f.bom_id
+             WHERE {bom_filter}
+             ORDER BY f.bom_id, f.product_id
+        """, params)
+        component_rows = env.cr.fetchall()
+    else:
+        component_rows = component_check_rows(bom_filter, params)
+
+    # ── Audit Part 3: Identical BOMs across different finished goods ────────
+    # Sorted "Apply on Variants" values of every line that has some, as one text key
+    line_value_keys_query = """
+        SELECT mrp_bom_line_id AS line_id,
+               string_agg(product_template_attribute_value_id::text, '.' ORDER BY product_template_attribute_value_id) AS value_key
+          FROM mrp_bom_line_product_template_attribute_value_rel
+         GROUP BY mrp_bom_line_id
+    """
+    # Signature = md5 of the sorted (component, "Apply on Variants" values, uom, qty
+    # per unit of finished good) multiset, so variant-specific lines are neither
+    # merged nor summed. Grouping by signature finds every collision in one O(n) pass.
+    identical_groups = []
+    if CHECK_IDENTICAL_BOMS:
+        env.cr.execute(f"""
+            WITH normalized AS (
+                SELECT b.id AS bom_id, b.product_tmpl_id, b.product_id AS variant_id,
+                       l.product_id, COALESCE(v.value_key, '') AS value_key, l.product_uom_id,
+                       round((sum(l.product_qty) / NULLIF(b.product_qty, 0))::numeric, 6) AS unit_qty
+                  FROM mrp_bom b
+                  JOIN mrp_bom_line l ON l.bom_id = b.id
+                  LEFT JOIN ({line_value_keys_query}) v ON v.line_id = l.id
+                 WHERE {bom_filter}
+                 GROUP BY b.id, l.product_id, COALESCE(v.value_key, ''), l.product_uom_id
+            ), signature AS (
+                SELECT bom_id, concat_ws('-', product_tmpl_id, variant_id) AS fg_key,
+                       md5(string_agg(concat_ws(':', product_id, value_key, product_uom_id, unit_qty), ','
+                                      ORDER BY product_id, value_key, product_uom_id)) AS sig
+                  FROM normalized
+                 GROUP BY bom_id, product_tmpl_id, variant_id
+            )
+            SELECT sig, array_agg(bom_id ORDER BY bom_id)
+              FROM signature
+             GROUP BY sig
+            HAVING count(DISTINCT fg_key) > 1
+        """, params)
+        identical_groups = [r[1] for r in env.cr.fetchall()]
+
+    # Near-duplicates: MinHash signatures over component sets, LSH banding to
+    # find candidate pairs, exact Jaccard check on candidates only. Components are
+    # keyed by (product, "Apply on Variants" values) like the exact signature.
+    near_duplicate_groups = []
+    if NEAR_DUPLICATE_THRESHOLD:
+        env.cr.execute(f"""
+            SELECT b.id, concat_ws('-', b.product_tmpl_id, b.product_id),
+                   array_agg(DISTINCT concat_ws(':', l.product_id, COALESCE(v.value_key, '')))
+              FROM mrp_bom b
+              JOIN mrp_bom_line l ON l.bom_id = b.id
+              LEFT JOIN ({line_value_keys_query}) v ON v.line_id = l.id
+             WHERE {bom_filter}
+             GROUP BY b.id
+        """, params)
+        component_sets = {}
+        bom_fg = {}
+        # (product, values) keys -> small integers for the hash family
+        component_key_ids = {}
+        for bom_id, fg_key, component_keys in env.cr.fetchall():
+            component_sets[bom_id] = set(component_key_ids.setdefault(k, len(component_key_ids) + 1) for k in component_keys)
+            bom_fg[bom_id] = fg_key
+
+        # Deterministic universal hash family h(x) = (a * x + b) mod PRIME
+        PRIME = 2147483647
+        seed = 12345
+        hash_params = []
+        for k in range(MINHASH_PERMUTATIONS):
+            seed = (seed * 1103515245 + 12345) % PRIME
+            a = seed or 1
+            seed = (seed * 1103515245 + 12345) % PRIME
+            hash_params.append((a, seed))
+        rows_per_band = max(1, MINHASH_PERMUTATIONS // MINHASH_BANDS)
+
+        buckets = {}
+        for bom_id, components in component_sets.items():
+            signature = [min([(a * x + b) % PRIME for x in components]) for a, b in hash_params]
+            for band in range(MINHASH_BANDS):
+                chunk = tuple(signature[band * rows_per_band:(band + 1) * rows_per_band])
+                if chunk:
+                    buckets.setdefault((band, chunk), []).append(bom_id)
+
+        # Union-find over verified pairs -> clusters of near-duplicate BOMs
+        parent = {}
+        def find_root(x):
+            while parent.get(x, x) != x:
+                x = parent[x]
+            return x
+
+        identical_bom_ids = set(b for group in identical_groups for b in group)
+        checked_pairs = set()
+        for members in buckets.values():
+            if len(members) < 2 or len(members) > MAX_BUCKET_SIZE:
+                continue
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    b1, b2 = members[x], members[y]
+                    if (b1, b2) in checked_pairs or bom_fg[b1] == bom_fg[b2]:
+                        continue
+                    checked_pairs.add((b1, b2))
+                    if b1 in identical_bom_ids and b2 in identical_bom_ids:
+                        continue
+                    s1, s2 = component_sets[b1], component_sets[b2]
+                    if len(s1 & s2) / len(s1 | s2) >= NEAR_DUPLICATE_THRESHOLD:
+                        r1, r2 = find_root(b1), find_root(b2)
+                        if r1 != r2:
+                            parent[max(r1, r2)] = min(r1, r2)
+
+        clusters = {}
+        for bom_id in parent:
+            clusters.setdefault(find_root(bom_id), set()).add(bom_id)
+        for root, members in clusters.items():
+            members.add(root)
+            near_duplicate_groups.append(sorted(members))
+        near_duplicate_groups.sort()
+
+    duplicate_rows = [r for r in component_rows if r[2] > 1]
+    archived_rows = [r for r in component_rows if r[3]]
+    zero_qty_rows = [r for r in component_rows if r[4]]
+    duplicate_line_total = sum(r[2] - 1 for r in duplicate_rows)
+
+    # ── Resolve names for offending rows only (one read per model) ──────────
+    bom_ids = set(r[0] for r in component_rows)
+    for tmpl_id, variant_id, ids in multi_bom_rows:
+        bom_ids.update(ids)
+    for group in identical_groups + near_duplicate_groups:
+        bom_ids.update(group)
+    component_ids = set(r[1] for r in component_rows)
+
+    bom_info = {}
+    for b in env['mrp.bom'].with_context(active_test=False).browse(list(bom_ids)).read(['display_name', 'product_tmpl_id', 'product_id']):
+        bom_info[b['id']] = b
+    variant_ids = component_ids | set(r[1] for r in multi_bom_rows if r[1])
+    variant_ids.update(b['product_id'][0] for b in bom_info.values() if b['product_id'])
+    template_ids = set(r[0] for r in multi_bom_rows)
+    template_ids.update(b['product_tmpl_id'][0] for b in bom_info.values() if not b['product_id'])
+
+    variant_names = {p['id']: p['display_name'] for p in env['product.product'].with_context(active_test=False).browse(list(variant_ids)).read(['display_name'])}
+    template_names = {t['id']: t['display_name'] for t in env['product.template'].with_context(active_test=False).browse(list(template_ids)).read(['display_name'])}
+
+    def fg_name_of(tmpl_id, variant_id):
+        return variant_names.get(variant_id) if variant_id else template_names.get(tmpl_id)
+
+    def fg_key_of_bom(bom_id):
+        b = bom_info[bom_id]
+        return (b['product_tmpl_id'][0], b['product_id'][0] if b['product_id'] else False)
+
+    def fg_name_of_bom(bom_id):
+        fg_key = fg_key_of_bom(bom_id)
+        return fg_name_of(fg_key[0], fg_key[1])
+
+    def bom_name_of(bom_id):
+        return bom_info[bom_id]['display_name']
 
     # ── Report Generation (Finished Good Centric) ───────────────────────────
     note_html = "<h3>BOM Quality Audit Report</h3>"
     has_issues = False
 
     # Issue Type A: Multiple BOMs for same Finished Good
-    multi_bom_variants = {fg: data for fg, data in variant_audit_map.items() if len(data['boms']) > 1}
-    if multi_bom_variants:
+    if multi_bom_rows:
         has_issues = True
         note_html += "<h4>⚠️ Multiple BOMs for One Finished Good</h4><ul>"
-        for fg, data in multi_bom_variants.items():
-            note_html += f"<li><b>{fg}</b> has {len(data['boms'])} BoMs: <i>({', '.join(data['boms'])})</i></li>"
+        for tmpl_id, variant_id, ids in multi_bom_rows[:MAX_REPORT_ROWS]:
+            names = ', '.join(bom_name_of(b) for b in ids)
+            note_html += f"<li><b>{fg_name_of(tmpl_id, variant_id)}</b> has {len(ids)} BoMs: <i>({names})</i></li>"
         note_html += "</ul>"
 
     # Issue Type B: Duplicate Component Entries (Grouped by Finished Good)
-    fg_with_dupes = {fg: data for fg, data in variant_audit_map.items() if data['duplicates']}
-    if fg_with_dupes:
+    if duplicate_rows:
         has_issues = True
+        # {fg_key: {bom_id: [(component_id, count)]}} keyed by ids, not names
+        fg_dupes = {}
+        for bom_id, product_id, count, archived, zero_count in duplicate_rows[:MAX_REPORT_ROWS]:
+            fg_dupes.setdefault(fg_key_of_bom(bom_id), {}).setdefault(bom_id, []).append((product_id, count))
+
         note_html += "<h4>🛑 Duplicate Component Entries (By Finished Good)</h4>"
         note_html += "<table border='1' style='width:100%; border-collapse: collapse; font-size: 11px;'>"
         note_html += "<tr style='background: #f2f2f2;'><th>Finished Good</th><th>BOM Name</th><th>Duplicate Component</th><th>Count</th></tr>"
-        
-        for fg, data in fg_with_dupes.items():
+
+        for fg_key, boms in fg_dupes.items():
             fg_first = True
-            fg_rowspan = sum(len(d) for d in data['duplicates'].values())
-            
-            for bom_name, dupes in data['duplicates'].items():
+            fg_rowspan = sum(len(d) for d in boms.values())
+
+            for bom_id, dupes in boms.items():
                 bom_first = True
                 bom_rowspan = len(dupes)
-                
-                for p_name, count in dupes.items():
+
+                for product_id, count in dupes:
                     note_html += "<tr>"
                     if fg_first:
-                        note_html += f"<td rowspan='{fg_rowspan}' style='padding:4px; vertical-align:top;'><b>{fg}</b></td>"
+                        note_html += f"<td rowspan='{fg_rowspan}' style='padding:4px; vertical-align:top;'><b>{fg_name_of(fg_key[0], fg_key[1])}</b></td>"
                         fg_first = False
                     if bom_first:
-                        note_html += f"<td rowspan='{bom_rowspan}' style='padding:4px; vertical-align:top;'>{bom_name}</td>"
+                        note_html += f"<td rowspan='{bom_rowspan}' style='padding:4px; vertical-align:top;'>{bom_name_of(bom_id)}</td>"
                         bom_first = False
-                    note_html += f"<td style='padding:4px;'>{p_name}</td><td style='padding:4px;'><b>{count}</b></td></tr>"
+                    note_html += f"<td style='padding:4px;'>{variant_names.get(product_id)}</td><td style='padding:4px;'><b>{count}</b></td></tr>"
         note_html += "</table>"
 
+    # Issue Type C: Archived Components
+    if archived_rows:
+        has_issues = True
+        note_html += "<h4>🗄️ Archived Components</h4><ul>"
+        for bom_id, product_id, count, archived, zero_count in archived_rows[:MAX_REPORT_ROWS]:
+            note_html += f"<li><b>{fg_name_of_bom(bom_id)}</b> ({bom_name_of(bom_id)}): {variant_names.get(product_id)}</li>"
+        note_html += "</ul>"
+
+    # Issue Type D: Zero Quantity Lines
+    if zero_qty_rows:
+        has_issues = True
+        note_html += "<h4>0️⃣ Zero Quantity Lines</h4><ul>"
+        for bom_id, product_id, count, archived, zero_count in zero_qty_rows[:MAX_REPORT_ROWS]:
+            note_html += f"<li><b>{fg_name_of_bom(bom_id)}</b> ({bom_name_of(bom_id)}): {variant_names.get(product_id)} x{zero_count}</li>"
+        note_html += "</ul>"
+
+    # Issue Type E: Identical BOMs across different Finished Goods
+    if identical_groups:
+        has_issues = True
+        note_html += "<h4>🧬 Identical BOMs Across Products (Kit/Template Candidates)</h4><ul>"
+        for group in identical_groups[:MAX_REPORT_ROWS]:
+            names = ', '.join(f"{fg_name_of_bom(b)} ({bom_name_of(b)})" for b in group)
+            note_html += f"<li>{len(group)} identical BoMs: <i>{names}</i></li>"
+        note_html += "</ul>"
+
+    # Issue Type F: Near-Duplicate BOMs (similar component sets)
+    if near_duplicate_groups:
+        has_issues = True
+        note_html += f"<h4>🔍 Near-Duplicate BOMs (≥ {int(NEAR_DUPLICATE_THRESHOLD * 100)}% shared components)</h4><ul>"
+        for group in near_duplicate_groups[:MAX_REPORT_ROWS]:
+            names = ', '.join(f"{fg_name_of_bom(b)} ({bom_name_of(b)})" for b in group)
+            note_html += f"<li>{len(group)} similar BoMs: <i>{names}</i></li>"
+        note_html += "</ul>"
+
     if has_issues:
+        affected_fg_count = len(set([(r[0], r[1] or False) for r in multi_bom_rows] + [fg_key_of_bom(r[0]) for r in component_rows]))
+
         # Create Single Summary Activity for User
         res_partner_model = env['ir.model'].search([('model', '=', 'res.partner')], limit=1)
         type_todo = env.ref('mail.mail_activity_data_todo', raise_if_not_found=False) or env['mail.activity.type'].search([], limit=1)
-        
+
         env['mail.activity'].create({
             'res_id': env.user.partner_id.id,
             'res_model_id': res_partner_model.id,
             'activity_type_id': type_todo.id,
-            'summary': f'BOM AUDIT: Issues found in {len(multi_bom_variants) + len(fg_with_dupes)} Finished Goods',
+            'summary': f'BOM AUDIT: Issues found in {affected_fg_count} Finished Goods',
             'note': note_html,
             'user_id': env.user.id,
         })
-        
+
         action = {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
                 'title': 'Audit Complete - Issues Found',
-                'message': f'Found {len(multi_bom_variants)} multi-BOM variants and {duplicate_line_total} duplicate lines. Check your activity!',
+                'message': f'Found {len(multi_bom_rows)} multi-BOM variants, {duplicate_line_total} duplicate lines, '
+                           f'{len(archived_rows)} archived components, {len(zero_qty_rows)} zero-qty components, '
+                           f'{len(identical_groups)} identical and {len(near_duplicate_groups)} near-duplicate BOM groups. Check your activity!'
+                           + (f' ({rechecked_count} changed BOMs re-checked)' if rechecked_count is not None else ''),
                 'type': 'danger',
                 'sticky': True
             }
@@ -131,13 +546,16 @@ else:
             'tag': 'display_notification',
             'params': {
                 'title': 'Audit Clean',
-                'message': 'No duplicates or multiple BOM instances found in selected records.',
+                'message': 'No duplicates, multiple BOM instances, archived or zero-qty components found.'
+                           + (f' ({rechecked_count} changed BOMs re-checked)' if rechecked_count is not None else ''),
                 'type': 'success',
                 'sticky': False
             }
         }
 
 ## Dual-Core Audit: Lines and BOM Instances
+## SQL-Aggregated, Database-Wide
+## Cached Per-Variant BoM Expansion
 ## Activity Summary Report
 ## Powered By HSx Tech
-## Ali Muzafar 
+## Ali Muzafar
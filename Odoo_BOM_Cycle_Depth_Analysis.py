@@ -0,0 +1,278 @@
+# Odoo Server Action: Multi-Level BOM Cycle & Depth Analysis
+# Model: Bill of Materials (mrp.bom)
+# Action To Do: Execute Python Code
+#
+# Usage:
+# Run this action from the Action menu of the BOM list (no selection needed).
+# It analyses the WHOLE database across BOM levels:
+# 1. Finds cycles (a component whose own BOM eventually contains the parent),
+#    which make MRP explode recursively and time out.
+# 2. Reports the maximum explosion depth per finished good.
+#
+# How it works:
+# The product -> component graph is built from mrp.bom / mrp.bom.line in one read.
+# Lines limited to some variants ("Apply on Variants") only link the variants they
+# apply to (like _skip_bom_line): template BoMs explode per attribute combination
+# (the values their lines filter on), shared by every variant with that combination.
+# Cycles are the strongly-connected components found by Tarjan's algorithm
+# (iterative, linear in the number of BOM lines). Tarjan emits components in
+# reverse topological order, so depths are computed in the same pass.
+# Part of HSx TECH BOM Cleanup Tools - Powered by Ali Muzafar
+
+# ── Configuration ────────────────────────────────────────────────────────────
+# Max rows listed per section in the activity note (counts are always complete)
+MAX_REPORT_ROWS = 200
+# ─────────────────────────────────────────────────────────────────────────────
+
+# ── 1. Build the graph in one read ──────────────────────────────────────────
+# Nodes: ('p', variant_id) and ('t', template_id, combination).
+# A variant explodes through its own BoM if it has one, otherwise through its
+# template's BoMs (same resolution as Odoo's _bom_find). The variant -> template
+# hop is a 0-level edge so template BoMs are not copied per variant, only per
+# combination of the attribute values their lines filter on.
+env.cr.execute("""
+    SELECT b.product_tmpl_id, b.product_id, l.id, l.product_id, c.product_tmpl_id
+      FROM mrp_bom b
+      JOIN mrp_bom_line l ON l.bom_id = b.id
+      JOIN product_product c ON c.id = l.product_id
+     WHERE b.active
+""")
+bom_rows = env.cr.fetchall()
+
+# "Apply on Variants" filters: line -> {attribute: values}
+env.cr.execute("""
+    SELECT b.product_tmpl_id, b.product_id, l.id, v.attribute_id, v.id
+      FROM mrp_bom_line l
+      JOIN mrp_bom b ON b.id = l.bom_id
+      JOIN mrp_bom_line_product_template_attribute_value_rel r ON r.mrp_bom_line_id = l.id
+      JOIN product_template_attribute_value v ON v.id = r.product_template_attribute_value_id
+      JOIN product_attribute a ON a.id = v.attribute_id AND a.create_variant != 'no_variant'
+     WHERE b.active
+""")
+line_filters = {}
+template_filter_attributes = {}   # attributes filtered on by a template's template-level BoMs
+filtered_template_ids = set()
+for tmpl_id, variant_id, line_id, attribute_id, ptav_id in env.cr.fetchall():
+    line_filters.setdefault(line_id, {}).setdefault(attribute_id, set()).add(ptav_id)
+    if not variant_id:
+        template_filter_attributes.setdefault(tmpl_id, set()).add(attribute_id)
+    filtered_template_ids.add(tmpl_id)
+
+# Attribute values of the variants of those templates only
+env.cr.execute("""
+    SELECT c.product_product_id, v.id, v.attribute_id
+      FROM product_variant_combination c
+      JOIN product_template_attribute_value v ON v.id = c.product_template_attribute_value_id
+     WHERE v.product_tmpl_id = ANY(%s)
+""", (list(filtered_template_ids),))
+variant_values = {}
+for variant_id, ptav_id, attribute_id in env.cr.fetchall():
+    variant_values.setdefault(variant_id, []).append((ptav_id, attribute_id))
+
+def line_applies(line_id, values):
+    return all(values & ptav_ids for ptav_ids in line_filters.get(line_id, {}).values())
+
+def template_node(tmpl_id, variant_id):
+    """Explosion node of a variant going through its template's BoMs."""
+    attributes = template_filter_attributes.get(tmpl_id)
+    if not attributes:
+        return ('t', tmpl_id, ())
+    return ('t', tmpl_id, tuple(sorted(v for v, a in variant_values.get(variant_id, []) if a in attributes)))
+
+# Finished goods with an active BoM (including BoMs without lines)
+env.cr.execute("SELECT DISTINCT product_tmpl_id, product_id FROM mrp_bom WHERE active")
+bom_products = env.cr.fetchall()
+
+variants_with_bom = set(r[1] for r in bom_products if r[1])
+templates_with_bom = set(r[0] for r in bom_products if not r[1])
+
+# Template-level finished goods: one node per combination of their active variants
+env.cr.execute("SELECT id, product_tmpl_id FROM product_product WHERE active AND product_tmpl_id = ANY(%s)",
+               (list(templates_with_bom),))
+finished_goods = set(('p', v) for v in variants_with_bom)
+template_fg_nodes = {}
+for variant_id, tmpl_id in env.cr.fetchall():
+    if variant_id not in variants_with_bom:
+        template_fg_nodes.setdefault(tmpl_id, set()).add(template_node(tmpl_id, variant_id))
+for tmpl_id in templates_with_bom:
+    finished_goods.update(template_fg_nodes.get(tmpl_id) or [('t', tmpl_id, ())])
+finished_goods = sorted(finished_goods)
+
+# graph[node] = [(child_node, level_increment)]
+graph = {}
+template_lines = {}
+template_nodes = set(n for n in finished_goods if n[0] == 't')
+linked_to_template = set()
+for tmpl_id, variant_id, line_id, component_id, component_tmpl_id in bom_rows:
+    if variant_id:
+        if line_applies(line_id, set(v for v, a in variant_values.get(variant_id, []))):
+            graph.setdefault(('p', variant_id), []).append((('p', component_id), 1))
+    else:
+        template_lines.setdefault(tmpl_id, []).append((line_id, component_id))
+
+    # Component without its own BoM explodes through its template's BoMs
+    if component_id not in variants_with_bom and component_tmpl_id in templates_with_bom:
+        if component_id not in linked_to_template:
+            linked_to_template.add(component_id)
+            target = template_node(component_tmpl_id, component_id)
+            template_nodes.add(target)
+            graph.setdefault(('p', component_id), []).append((target, 0))
+
+# Template nodes: the lines of the template's BoMs that apply to the combination
+for node in template_nodes:
+    values = set(node[2])
+    for line_id, component_id in template_lines.get(node[1], []):
+        if line_applies(line_id, values):
+            graph.setdefault(node, []).append((('p', component_id), 1))
+
+edge_count = sum(len(edges) for edges in graph.values())
+log(f"BOM graph built: {len(graph)} exploding nodes, {edge_count} edges.", level='info')
+
+# ── 2. Tarjan's SCC (iterative) + depth per component ──────────────────────
+index_of = {}
+lowlink = {}
+on_stack = set()
+stack = []
+scc_of = {}
+scc_members = []
+scc_depth = []   # None = reaches a cycle (infinite explosion)
+next_index = 0
+
+all_nodes = list(graph.keys())
+for start in all_nodes:
+    if start in index_of:
+        continue
+    # Work stack of (node, position in its edge list)
+    work = [(start, 0)]
+    while work:
+        node, pos = work[-1]
+        if pos == 0 and node not in index_of:
+            index_of[node] = next_index
+            lowlink[node] = next_index
+            next_index += 1
+            stack.append(node)
+            on_stack.add(node)
+
+        edges = graph.get(node, [])
+        if pos < len(edges):
+            work[-1] = (node, pos + 1)
+            child = edges[pos][0]
+            if child not in index_of:
+                work.append((child, 0))
+            elif child in on_stack:
+                lowlink[node] = min(lowlink[node], index_of[child])
+            continue
+
+        # All edges done: close the node
+        work.pop()
+        if work:
+            parent_node = work[-1][0]
+            lowlink[parent_node] = min(lowlink[parent_node], lowlink[node])
+
+        if lowlink[node] == index_of[node]:
+            members = []
+            while True:
+                member = stack.pop()
+                on_stack.discard(member)
+                scc_of[member] = len(scc_members)
+                members.append(member)
+                if member == node:
+                    break
+            scc_id = len(scc_members)
+            scc_members.append(members)
+
+            # Children SCCs are already closed (reverse topological order)
+            is_cycle = len(members) > 1 or any(e[0] == node for e in graph.get(node, []))
+            depth = 0
+            for member in members:
+                for child, step in graph.get(member, []):
+                    child_scc = scc_of[child]
+                    if child_scc == scc_id:
+                        continue
+                    if scc_depth[child_scc] is None:
+                        is_cycle = True
+                        break
+                    depth = max(depth, scc_depth[child_scc] + step)
+            scc_depth.append(None if is_cycle else depth)
+
+cycles = [members for members in scc_members
+          if len(members) > 1 or any(e[0] == members[0] for e in graph.get(members[0], []))]
+
+# Depth per finished good (1 = the BoM only contains raw components)
+fg_depths = []
+for node in finished_goods:
+    depth = scc_depth[scc_of[node]] if node in scc_of else 0
+    fg_depths.append((node, None if depth is None else max(depth, 1)))
+
+cyclic_fgs = [n for n, d in fg_depths if d is None]
+finite_depths = sorted([(d, n) for n, d in fg_depths if d is not None], key=lambda x: (-x[0], x[1]))
+max_depth = finite_depths[0][0] if finite_depths else 0
+
+# ── 3. Resolve names for reported nodes only ────────────────────────────────
+report_nodes = set(cyclic_fgs[:MAX_REPORT_ROWS]) | set(n for d, n in finite_depths[:MAX_REPORT_ROWS])
+for members in cycles[:MAX_REPORT_ROWS]:
+    report_nodes.update(members)
+variant_names = {p['id']: p['display_name'] for p in env['product.product'].with_context(active_test=False).browse(
+    [n[1] for n in report_nodes if n[0] == 'p']).read(['display_name'])}
+template_names = {t['id']: t['display_name'] for t in env['product.template'].with_context(active_test=False).browse(
+    [n[1] for n in report_nodes if n[0] == 't']).read(['display_name'])}
+value_names = {v['id']: v['name'] for v in env['product.template.attribute.value'].browse(
+    list(set(v for n in report_nodes if n[0] == 't' for v in n[2]))).read(['name'])}
+
+def node_name(node):
+    if node[0] == 'p':
+        return variant_names.get(node[1])
+    if not node[2]:
+        return f"{template_names.get(node[1])} (all variants)"
+    return f"{template_names.get(node[1])} ({', '.join(value_names.get(v, '') for v in node[2])} variants)"
+
+# ── 4. Report ───────────────────────────────────────────────────────────────
+note_html = "<h3>Multi-Level BOM Cycle & Depth Analysis</h3>"
+note_html += "<ul>"
+note_html += f"<li>Finished Goods analysed: <b>{len(fg_depths)}</b></li>"
+note_html += f"<li>Graph edges (BOM lines): <b>{edge_count}</b></li>"
+note_html += f"<li>Cycles found: <b>{len(cycles)}</b></li>"
+note_html += f"<li>Finished Goods exploding into a cycle: <b>{len(cyclic_fgs)}</b></li>"
+note_html += f"<li>Maximum explosion depth: <b>{max_depth}</b></li>"
+note_html += "</ul>"
+
+if cycles:
+    note_html += "<h4>🔁 BOM Cycles</h4><ul>"
+    for members in cycles[:MAX_REPORT_ROWS]:
+        note_html += f"<li>{len(members)} products: <i>{', '.join(node_name(m) for m in members)}</i></li>"
+    note_html += "</ul>"
+
+if finite_depths:
+    note_html += "<h4>📏 Deepest Finished Goods</h4>"
+    note_html += "<table border='1' style='width:100%; border-collapse: collapse; font-size: 11px;'>"
+    note_html += "<tr style='background: #f2f2f2;'><th>Finished Good</th><th>Levels</th></tr>"
+    for depth, node in finite_depths[:MAX_REPORT_ROWS]:
+        note_html += f"<tr><td style='padding:4px;'>{node_name(node)}</td><td style='padding:4px;'><b>{depth}</b></td></tr>"
+    note_html += "</table>"
+
+res_partner_model = env['ir.model'].search([('model', '=', 'res.partner')], limit=1)
+type_todo = env.ref('mail.mail_activity_data_todo', raise_if_not_found=False) or env['mail.activity.type'].search([], limit=1)
+
+env['mail.activity'].create({
+    'res_id': env.user.partner_id.id,
+    'res_model_id': res_partner_model.id,
+    'activity_type_id': type_todo.id,
+    'summary': f'BOM STRUCTURE: {len(cycles)} cycles, max depth {max_depth}',
+    'note': note_html,
+    'user_id': env.user.id,
+})
+
+action = {
+    'type': 'ir.actions.client',
+    'tag': 'display_notification',
+    'params': {
+        'title': 'Cycle Analysis Complete' if not cycles else 'Cycle Analysis - Cycles Found',
+        'message': f'{len(cycles)} cycles ({len(cyclic_fgs)} finished goods affected), maximum depth {max_depth}. Check your activity!',
+        'type': 'success' if not cycles else 'danger',
+        'sticky': True,
+    }
+}
+
+## Tarjan SCC Cycle Detection
+## Activity Summary Report
+## Powered By HSx Tech - Ali Muzafar
@@ -0,0 +1,135 @@
+# Odoo Server Action: BOM Line Duplicate Guard
+# Part of Odoo BOM Cleanup Tools - Powered by Hsx TECH
+# Model: BOM Line (mrp.bom.line)
+# Action To Do: Execute Python Code
+#
+# Usage:
+# Stops duplicate components at the moment they are created, so the periodic
+# duplicate cleanup scans are no longer needed. Pick ONE guard:
+#
+# A. Database guard (GUARD_MODE = 'index'):
+#    Run once from the Action menu. Creates a unique index on
+#    mrp_bom_line (bom_id, product_id); any later duplicate insert is rejected
+#    by PostgreSQL. Existing duplicates must be removed first
+#    (Odoo_remove_duplicates_products.py). GUARD_MODE = 'drop_index' removes it.
+#    Note: the index also blocks variant-specific lines (same component with
+#    different "Apply on Variants" values), so it is refused while such lines
+#    exist - use the automation guard if you need them.
+#
+# B. Automation guard (GUARD_MODE = 'merge' or 'reject'):
+#    Create an Automation Rule on BOM Line, trigger "On Creation" (and optionally
+#    "On Update" of Component), action "Execute Python Code" with this script.
+#    'merge'  : the new line's quantity (converted to the existing line's UoM) is
+#               added to the line already in the BOM and the new line is removed.
+#    'reject' : the creation is refused with an error listing the components.
+#    Lines only count as duplicates when they share BOM, component, operation
+#    and variant values.
+
+# ── Configuration ────────────────────────────────────────────────────────────
+GUARD_MODE = 'merge'
+INDEX_NAME = 'hsx_mrp_bom_line_bom_product_uniq'
+# ─────────────────────────────────────────────────────────────────────────────
+
+if GUARD_MODE not in ('index', 'drop_index', 'merge', 'reject'):
+    raise UserError("GUARD_MODE must be 'index', 'drop_index', 'merge' or 'reject'.")
+
+if GUARD_MODE in ('index', 'drop_index'):
+    if GUARD_MODE == 'index':
+        # The index cannot be built while a component appears twice in a BOM:
+        # either real duplicates (same variant values) or variant-specific lines
+        env.cr.execute("""
+            SELECT count(*) FILTER (WHERE value_sets = 1),
+                   count(*) FILTER (WHERE value_sets > 1)
+              FROM (
+                SELECT count(DISTINCT COALESCE(v.value_ids, '{}')) AS value_sets
+                  FROM mrp_bom_line l
+                  LEFT JOIN (
+                      SELECT mrp_bom_line_id,
+                             array_agg(product_template_attribute_value_id ORDER BY product_template_attribute_value_id) AS value_ids
+                        FROM mrp_bom_line_product_template_attribute_value_rel
+                       GROUP BY mrp_bom_line_id
+                  ) v ON v.mrp_bom_line_id = l.id
+                 GROUP BY l.bom_id, l.product_id
+                HAVING count(*) > 1
+              ) dupes
+        """)
+        duplicate_count, variant_specific_count = env.cr.fetchone()
+        if variant_specific_count:
+            raise UserError(f"{variant_specific_count} component(s) have variant-specific BOM lines "
+                            "(\"Apply on Variants\"), which a unique index would reject. "
+                            "Use GUARD_MODE = 'merge' or 'reject' as an automation rule instead.")
+        if duplicate_count:
+            raise UserError(f"{duplicate_count} duplicate component(s) exist in BOM lines. "
+                            "Remove them first (Odoo_remove_duplicates_products.py) and run this action again.")
+
+        env.cr.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {INDEX_NAME} ON mrp_bom_line (bom_id, product_id)")
+        message = f"Unique index {INDEX_NAME} is active: duplicate components are now rejected by the database."
+    else:
+        env.cr.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+        message = f"Unique index {INDEX_NAME} removed."
+
+    log(message, level='info')
+    action = {
+        'type': 'ir.actions.client',
+        'tag': 'display_notification',
+        'params': {
+            'title': 'BOM Duplicate Guard',
+            'message': message,
+            'type': 'success',
+            'sticky': False,
+        }
+    }
+
+elif records:
+    # ── Automation guard ────────────────────────────────────────────────────
+    new_ids = set(records.ids)
+
+    def line_key(line):
+        return (line['bom_id'][0], line['product_id'][0],
+                line['operation_id'] and line['operation_id'][0],
+                tuple(sorted(line['bom_product_template_attribute_value_ids'])))
+
+    # Every line of the touched BOMs with the same components, in ONE read
+    # (search_read flushes the new lines first)
+    candidates = env['mrp.bom.line'].search_read([
+        ('bom_id', 'in', records.mapped('bom_id').ids),
+        ('product_id', 'in', records.mapped('product_id').ids),
+    ], ['bom_id', 'product_id', 'product_qty', 'product_uom_id', 'operation_id',
+        'bom_product_template_attribute_value_ids'], order='sequence, id')
+
+    groups = {}
+    for line in candidates:
+        groups.setdefault(line_key(line), []).append(line)
+
+    # Keeper = first existing line of the group (or the first new line when all are new)
+    merges = []
+    for lines in groups.values():
+        if len(lines) < 2:
+            continue
+        existing = [l for l in lines if l['id'] not in new_ids]
+        keeper = existing[0] if existing else lines[0]
+        extras = [l for l in lines if l['id'] in new_ids and l['id'] != keeper['id']]
+        if extras:
+            merges.append((keeper, extras))
+
+    if merges and GUARD_MODE == 'reject':
+        names = sorted(set(keeper['product_id'][1] for keeper, extras in merges))
+        raise UserError("These components are already in the Bill of Materials:\n" + "\n".join(names))
+
+    to_unlink = []
+    Uom = env['uom.uom']
+    for keeper, extras in merges:
+        keeper_uom = Uom.browse(keeper['product_uom_id'][0])
+        qty = keeper['product_qty']
+        for extra in extras:
+            qty += Uom.browse(extra['product_uom_id'][0])._compute_quantity(extra['product_qty'], keeper_uom)
+            to_unlink.append(extra['id'])
+        env['mrp.bom.line'].browse(keeper['id']).write({'product_qty': qty})
+
+    if to_unlink:
+        env['mrp.bom.line'].browse(to_unlink).unlink()
+        log(f"BOM duplicate guard merged {len(to_unlink)} new line(s) into {len(merges)} existing line(s).", level='info')
+
+## Database-Level or Automation Duplicate Guard
+## Quantity Merge on Conflict
+## Powered By HSx Tech - Ali Muzafar
@@ -0,0 +1,264 @@
+# Odoo Server Action: Multi-Level BOM Roll-Up (Cost & Weight)
+# Model: Bill of Materials (mrp.bom) or Product Variant (product.product)
+# Action To Do: Execute Python Code
+#
+# Usage:
+# Run this action from the Action menu (no selection needed). It rolls up the
+# weight and/or cost of EVERY finished good from its multi-level BoM:
+#   value(finished good) = sum(component qty x value(component)) / BoM quantity
+# Components without a BoM keep their own weight / cost (leaves).
+#
+# How it works:
+# All active BoMs and lines are read once. Each product is exploded bottom-up in
+# topological order and every sub-assembly is computed ONCE (memoized), however
+# many finished goods use it. Quantities are converted through the UoM factors.
+# Lines limited to some variants ("Apply on Variants") only count for those
+# variants (like _skip_bom_line), so results are memoized per (BoM, attribute
+# combination): variants sharing the values the BoM filters on share one result.
+# Products are then grouped by their new value and written with one write per
+# value, skipping every product whose value did not change.
+
+# ── Configuration ────────────────────────────────────────────────────────────
+ROLLUP_WEIGHT = True
+# Note: with automated inventory valuation, changing the cost posts revaluation entries
+ROLLUP_COST = True
+# Products read / written per batch
+BATCH_SIZE = 1000
+# ─────────────────────────────────────────────────────────────────────────────
+
+if not ROLLUP_WEIGHT and not ROLLUP_COST:
+    raise UserError("Please enable ROLLUP_WEIGHT and/or ROLLUP_COST.")
+
+weight_digits = env['decimal.precision'].precision_get('Stock Weight')
+cost_digits = env['decimal.precision'].precision_get('Product Price')
+
+# ── 1. Read BoMs and lines once ─────────────────────────────────────────────
+# Output quantity in the finished good's UoM (qty / bom_uom.factor * product_uom.factor)
+env.cr.execute("""
+    SELECT b.id, b.product_tmpl_id, b.product_id,
+           b.product_qty::float / bu.factor::float * tu.factor::float
+      FROM mrp_bom b
+      JOIN uom_uom bu ON bu.id = b.product_uom_id
+      JOIN product_template t ON t.id = b.product_tmpl_id
+      JOIN uom_uom tu ON tu.id = t.uom_id
+     WHERE b.active
+     ORDER BY b.sequence, b.id
+""")
+bom_output_qty = {}
+bom_for_variant = {}
+bom_for_template = {}
+for bom_id, tmpl_id, variant_id, output_qty in env.cr.fetchall():
+    bom_output_qty[bom_id] = output_qty
+    # First BoM by sequence wins, variant-specific before template (like _bom_find)
+    if variant_id:
+        bom_for_variant.setdefault(variant_id, bom_id)
+    else:
+        bom_for_template.setdefault(tmpl_id, bom_id)
+
+# Line quantity in the component's UoM
+env.cr.execute("""
+    SELECT l.bom_id, l.id, l.product_id,
+           l.product_qty::float / lu.factor::float * cu.factor::float
+      FROM mrp_bom_line l
+      JOIN mrp_bom b ON b.id = l.bom_id
+      JOIN uom_uom lu ON lu.id = l.product_uom_id
+      JOIN product_product c ON c.id = l.product_id
+      JOIN product_template ct ON ct.id = c.product_tmpl_id
+      JOIN uom_uom cu ON cu.id = ct.uom_id
+     WHERE b.active
+""")
+bom_lines = {}
+component_ids = set()
+for bom_id, line_id, component_id, qty in env.cr.fetchall():
+    bom_lines.setdefault(bom_id, []).append((line_id, component_id, qty))
+    component_ids.add(component_id)
+
+# "Apply on Variants" filters: line -> {attribute: values}, BoM -> filtered attributes
+env.cr.execute("""
+    SELECT l.bom_id, l.id, v.attribute_id, v.id, b.product_tmpl_id
+      FROM mrp_bom_line l
+      JOIN mrp_bom b ON b.id = l.bom_id
+      JOIN mrp_bom_line_product_template_attribute_value_rel r ON r.mrp_bom_line_id = l.id
+      JOIN product_template_attribute_value v ON v.id = r.product_template_attribute_value_id
+      JOIN product_attribute a ON a.id = v.attribute_id AND a.create_variant != 'no_variant'
+     WHERE b.active
+""")
+line_filters = {}
+bom_filter_attributes = {}
+filtered_template_ids = set()
+for bom_id, line_id, attribute_id, ptav_id, tmpl_id in env.cr.fetchall():
+    line_filters.setdefault(line_id, {}).setdefault(attribute_id, set()).add(ptav_id)
+    bom_filter_attributes.setdefault(bom_id, set()).add(attribute_id)
+    filtered_template_ids.add(tmpl_id)
+
+# Attribute values of the variants of those templates only
+env.cr.execute("""
+    SELECT c.product_product_id, v.id, v.attribute_id
+      FROM product_variant_combination c
+      JOIN product_template_attribute_value v ON v.id = c.product_template_attribute_value_id
+     WHERE v.product_tmpl_id = ANY(%s)
+""", (list(filtered_template_ids),))
+variant_values = {}
+for variant_id, ptav_id, attribute_id in env.cr.fetchall():
+    variant_values.setdefault(variant_id, []).append((ptav_id, attribute_id))
+
+# Finished goods = variants with their own BoM + every active variant of a template BoM
+finished_variant_ids = set(bom_for_variant.keys())
+env.cr.execute("SELECT id, product_tmpl_id FROM product_product WHERE active AND product_tmpl_id = ANY(%s)",
+               (list(bom_for_template.keys()),))
+variant_template = {}
+for variant_id, tmpl_id in env.cr.fetchall():
+    variant_template[variant_id] = tmpl_id
+    finished_variant_ids.add(variant_id)
+
+# Current weight / cost of every product involved, read in batches (cost is company dependent)
+all_product_ids = list(component_ids | finished_variant_ids)
+current = {}
+Product = env['product.product'].with_context(active_test=False)
+for i in range(0, len(all_product_ids), BATCH_SIZE):
+    for p in Product.browse(all_product_ids[i:i + BATCH_SIZE]).read(['weight', 'standard_price', 'product_tmpl_id']):
+        current[p['id']] = (p['weight'] or 0.0, p['standard_price'] or 0.0)
+        variant_template.setdefault(p['id'], p['product_tmpl_id'][0])
+
+def bom_of(variant_id):
+    """BoM used to explode a variant, or None for a leaf."""
+    if variant_id in bom_for_variant:
+        return bom_for_variant[variant_id]
+    return bom_for_template.get(variant_template.get(variant_id))
+
+def node_of(variant_id):
+    """(BoM, combination) explosion node of a variant, or None for a leaf.
+
+    The combination only keeps the variant's values on attributes the BoM's lines
+    filter on, so every variant with the same values shares one node.
+    """
+    bom_id = bom_of(variant_id)
+    if bom_id is None:
+        return None
+    attributes = bom_filter_attributes.get(bom_id)
+    if not attributes:
+        return (bom_id, ())
+    return (bom_id, tuple(sorted(v for v, a in variant_values.get(variant_id, []) if a in attributes)))
+
+def node_lines(node):
+    """Lines of the node's BoM that apply to its combination (like _skip_bom_line)."""
+    values = set(node[1])
+    return [(component_id, qty) for line_id, component_id, qty in bom_lines.get(node[0], [])
+            if all(values & ptav_ids for ptav_ids in line_filters.get(line_id, {}).values())]
+
+# ── 2. Bottom-up roll-up, each (BoM, combination) computed once ─────────────
+# memo[node] = (weight, cost) per unit of the finished good's UoM
+memo = {}
+cyclic_nodes = set()
+
+def unit_value(variant_id):
+    node = node_of(variant_id)
+    if node is None:
+        return current.get(variant_id, (0.0, 0.0))
+    return memo.get(node)
+
+for root in set(node_of(v) for v in finished_variant_ids):
+    if root is None or root in memo:
+        continue
+    # Iterative post-order DFS over nodes (no recursion limit on deep structures)
+    stack = [(root, False)]
+    in_progress = set()
+    while stack:
+        node, children_done = stack.pop()
+        if node in memo:
+            continue
+        if not children_done:
+            if node in in_progress:
+                # Reached again before being closed: the structure loops
+                cyclic_nodes.add(node)
+                continue
+            in_progress.add(node)
+            stack.append((node, True))
+            for component_id, qty in node_lines(node):
+                child = node_of(component_id)
+                if child is not None and child not in memo:
+                    stack.append((child, False))
+            continue
+
+        in_progress.discard(node)
+        weight = 0.0
+        cost = 0.0
+        broken = node in cyclic_nodes
+        for component_id, qty in node_lines(node):
+            value = unit_value(component_id)
+            if value is None:
+                broken = True
+                break
+            weight += qty * value[0]
+            cost += qty * value[1]
+        output_qty = bom_output_qty[node[0]]
+        if broken or not output_qty:
+            cyclic_nodes.add(node)
+            memo[node] = None
+        else:
+            memo[node] = (weight / output_qty, cost / output_qty)
+
+# ── 3. Group changed products by new value ──────────────────────────────────
+weight_groups = {}
+cost_groups = {}
+skipped_count = 0
+for variant_id in finished_variant_ids:
+    value = memo.get(node_of(variant_id))
+    if value is None:
+        skipped_count += 1
+        continue
+    old_weight, old_cost = current.get(variant_id, (0.0, 0.0))
+    if ROLLUP_WEIGHT:
+        new_weight = round(value[0], weight_digits)
+        if float_compare(new_weight, old_weight, precision_digits=weight_digits) != 0:
+            weight_groups.setdefault(new_weight, []).append(variant_id)
+    if ROLLUP_COST:
+        new_cost = round(value[1], cost_digits)
+        if float_compare(new_cost, old_cost, precision_digits=cost_digits) != 0:
+            cost_groups.setdefault(new_cost, []).append(variant_id)
+
+# ── 4. One write per value, committed in batches ────────────────────────────
+writes = [('weight', v, ids) for v, ids in weight_groups.items()] + [('standard_price', v, ids) for v, ids in cost_groups.items()]
+total_writes = len(writes)
+updated_weight_count = sum(len(ids) for ids in weight_groups.values())
+updated_cost_count = sum(len(ids) for ids in cost_groups.values())
+
+log(f"Roll-up computed for {len(finished_variant_ids)} finished goods: "
+    f"{updated_weight_count} weights and {updated_cost_count} costs to update in {total_writes} grouped writes.", level='info')
+
+written = 0
+for field_name, value, ids in writes:
+    for i in range(0, len(ids), BATCH_SIZE):
+        Product.browse(ids[i:i + BATCH_SIZE]).write({field_name: value})
+    written += 1
+
+    if written % 100 == 0 or written == total_writes:
+        # Commit to save progress and release locks
+        env.cr.commit()
+        env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
+            'title': 'Roll-Up Progress',
+            'message': f'Applied {written}/{total_writes} grouped updates...',
+            'type': 'info',
+            'sticky': False
+        })
+
+message = f"✅ {len(finished_variant_ids)} finished goods rolled up"
+message += f"\n⚖️ {updated_weight_count} weights updated"
+message += f"\n💲 {updated_cost_count} costs updated"
+if skipped_count:
+    message += f"\n⚠️ {skipped_count} skipped (cyclic BoM or zero BoM quantity)"
+
+action = {
+    'type': 'ir.actions.client',
+    'tag': 'display_notification',
+    'params': {
+        'title': 'BOM Roll-Up Complete',
+        'message': message,
+        'type': 'success' if not skipped_count else 'warning',
+        'sticky': True
+    }
+}
+
+## Memoized Bottom-Up Explosion per Attribute Combination
+## Grouped Writes by Value
+## Powered By HSx Tech - Ali Muzafar
@@ -1,15 +1,24 @@
 # Odoo Server Action: Archive Duplicate BoMs for Product Variants
-# Model: Product Variant (product.product)
+# Model: Product Variant (product.product) or Product (product.template)
 # Action To Do: Execute Python Code
 #
 # Usage:
 # Select Product Variants in the list view (Manufacturing > Products > Product Variants)
 # and run this action from the Action menu.
-# It checks if a variant has multiple BoMs specifically assigned to it,
-# keeps the first one (based on sequence/ID), and archives the rest.
+# It checks if a variant has multiple BoMs specifically assigned to it, and if
+# its template has multiple template-level BoMs (no variant set). Per product it
+# keeps the BoM actually used the most (count of done manufacturing orders, then
+# sequence/ID) and archives the rest. BoMs of different companies or different
+# types (manufacture, kit, subcontracting) are never duplicates of each other.
+#
+# How it works:
+# All active BoMs of the selection are ranked in ONE query (ROW_NUMBER per
+# product, usage aggregated in the same query) and every rank > 1 BoM is
+# archived with one write per batch.
 
 BATCH_SIZE = 100
 
+active_model = env.context.get('active_model')
 active_ids = env.context.get('active_ids', [])
 if not active_ids and records:
     active_ids = records.ids
@@ -17,71 +26,119 @@ if not active_ids and records:
 if not active_ids:
     raise UserError("Please select at least one Product Variant to process.")
 
-total_variants = len(active_ids)
-success_count = 0
+# Resolve the selection to variant and template IDs
+if active_model == 'product.template':
+    env.cr.execute("SELECT id, product_tmpl_id FROM product_product WHERE product_tmpl_id = ANY(%s)", (list(active_ids),))
+else:
+    env.cr.execute("SELECT id, product_tmpl_id FROM product_product WHERE id = ANY(%s)", (list(active_ids),))
+selection_rows = env.cr.fetchall()
+variant_ids = [r[0] for r in selection_rows]
+template_ids = list(set(r[1] for r in selection_rows))
+total_variants = len(variant_ids)
+
+log(f"Starting batch duplicate BoM archival for {total_variants} selected variants...", level='info')
+
+# Rank every active BoM per product in ONE query:
+# variant BoMs per product_id, template BoMs (product_id empty) per product_tmpl_id,
+# each within its company and BoM type.
+# Keeper = most done manufacturing orders, then sequence, then ID.
+env.cr.execute("""
+    SELECT ranked.id, ranked.product_id, ranked.product_tmpl_id
+      FROM (
+        SELECT b.id, b.product_id, b.product_tmpl_id,
+               ROW_NUMBER() OVER (
+                   PARTITION BY b.product_tmpl_id, b.product_id, b.company_id, b.type
+                   ORDER BY COALESCE(u.done_count, 0) DESC, b.sequence, b.id
+               ) AS rank
+          FROM mrp_bom b
+          LEFT JOIN (
+              SELECT bom_id, count(*) AS done_count
+                FROM mrp_production
+               WHERE state = 'done' AND bom_id IS NOT NULL
+               GROUP BY bom_id
+          ) u ON u.bom_id = b.id
+         WHERE b.active
+           AND (b.product_id = ANY(%s)
+                OR (b.product_id IS NULL AND b.product_tmpl_id = ANY(%s)))
+      ) ranked
+     WHERE ranked.rank > 1
+     ORDER BY ranked.id
+""", (variant_ids, template_ids))
+duplicate_rows = env.cr.fetchall()
+
+duplicate_bom_ids = [r[0] for r in duplicate_rows]
+archived_variant_ids = set(r[1] for r in duplicate_rows if r[1])
+archived_template_ids = set(r[2] for r in duplicate_rows if not r[1])
+
+total_duplicates = len(duplicate_bom_ids)
 archived_bom_count = 0
 failed_count = 0
 
-archived_variant_names = []
+# Archive in batches: one write per batch
+for i in range(0, total_duplicates, BATCH_SIZE):
+    batch_ids = duplicate_bom_ids[i:i + BATCH_SIZE]
+    # Avoid 'with' as it's often restricted (forbidden opcodes)
+    # Use manual savepoints via SQL to protect the transaction
+    try:
+        env.cr.execute("SAVEPOINT archive_duplicate_boms")
+        env['mrp.bom'].browse(batch_ids).write({'active': False})
+        env.flush_all()
+        env.cr.execute("RELEASE SAVEPOINT archive_duplicate_boms")
+        archived_bom_count += len(batch_ids)
+    except Exception as e:
+        env.cr.execute("ROLLBACK TO SAVEPOINT archive_duplicate_boms")
+        env.invalidate_all()
+        log("Batch archive failed, falling back to individual BoMs: %s" % str(e), level='warning')
 
-log(f"Starting batch duplicate BoM archival for {total_variants} selected variants...", level='info')
+        # Fallback: BoM by BoM so one BoM still in use does not block the batch
+        for bom_id in batch_ids:
+            try:
+                env.cr.execute("SAVEPOINT archive_duplicate_bom")
+                env['mrp.bom'].browse(bom_id).write({'active': False})
+                env.flush_all()
+                env.cr.execute("RELEASE SAVEPOINT archive_duplicate_bom")
+                archived_bom_count += 1
+            except Exception as ex:
+                env.cr.execute("ROLLBACK TO SAVEPOINT archive_duplicate_bom")
+                env.invalidate_all()
+                log("Error archiving BoM %s: %s" % (env['mrp.bom'].browse(bom_id).display_name, str(ex)), level='error')
+                failed_count += 1
 
-# Process in chunks to avoid timeouts on large selections
-for i in range(0, total_variants, BATCH_SIZE):
-    batch_ids = active_ids[i:i + BATCH_SIZE]
-    variants = env['product.product'].browse(batch_ids)
-    
-    for variant in variants:
-        try:
-            # Find Active BoMs specifically assigned to this variant
-            # (If product_id is set, it specifically belongs to this variant)
-            boms = env['mrp.bom'].search([
-                ('product_id', '=', variant.id),
-                ('active', '=', True)
-            ], order='sequence asc, id asc')
-            
-            if len(boms) > 1:
-                # Keep the first one found (highest priority based on sequence/id)
-                # Archive the duplicates
-                duplicates = boms[1:]
-                duplicates.write({'active': False})
-                archived_bom_count += len(duplicates)
-                if variant.display_name not in archived_variant_names:
-                    archived_variant_names.append(variant.display_name)
-                
-            success_count += 1
-        except Exception:
-            failed_count += 1
-            
     # Commit to free up database locks
     env.cr.commit()
-    
+
     # Send a bus notification for each batch indicating progress
-    progress = min(i + BATCH_SIZE, total_variants)
+    progress = min(i + BATCH_SIZE, total_duplicates)
     try:
         env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
             'title': 'Batch Processing',
-            'message': f'Processed {progress}/{total_variants} variants (Archived {archived_bom_count} BoMs)...',
+            'message': f'Archived {progress}/{total_duplicates} duplicate BoMs...',
             'type': 'info',
             'sticky': False
         })
     except Exception:
         pass # Ignore failure if bus notifications are not fully set up
 
+# Names only for the products that actually had duplicates
+archived_names = [p['display_name'] for p in env['product.product'].with_context(active_test=False).browse(
+    list(archived_variant_ids)).read(['display_name'])]
+archived_names += [f"{t['display_name']} (template)" for t in env['product.template'].with_context(active_test=False).browse(
+    list(archived_template_ids)).read(['display_name'])]
+
 # Final summary bus notification
-message = f"✅ Processed {success_count} variants\n"
+message = f"✅ Processed {total_variants} variants\n"
 message += f"🗑️ Archived {archived_bom_count} duplicate BoMs"
 
-if archived_variant_names:
+if archived_names:
     # Truncate to avoid making the notification excessively long
-    if len(archived_variant_names) > 10:
-        names_str = ", ".join(archived_variant_names[:10]) + f" and {len(archived_variant_names) - 10} more"
+    if len(archived_names) > 10:
+        names_str = ", ".join(archived_names[:10]) + f" and {len(archived_names) - 10} more"
     else:
-        names_str = ", ".join(archived_variant_names)
-    message += f"\n\nVariants Updated:\n{names_str}"
+        names_str = ", ".join(archived_names)
+    message += f"\n\nProducts Updated:\n{names_str}"
 
 if failed_count:
-    message += f"\n❌ Failed to process {failed_count} variants"
+    message += f"\n❌ Failed to archive {failed_count} BoMs"
 
 action = {
     'type': 'ir.actions.client',
@@ -95,5 +152,6 @@ action = {
 }
 
 ## Optimized for Selected Records
+## Usage-Ranked Single-Query Detection
 ## Real-time Batch Notifications via Bus
 ## Powered By HSx Tech - Ali Muzafar
@@ -1,67 +1,86 @@
 # Odoo Server Action
 # Target Model: product.pricelist OR product.pricelist.item
-# Description: Checks product-level rules in pricelist, and automatically adds 
+# Description: Checks product-level rules in pricelist, and automatically adds
 #              corresponding variant-level rules for each product variant.
+#
+# Existing variant rules are indexed once per run (pricelist, variant, min qty,
+# date range), so each check is a set lookup. Missing rules are created with one
+# batched create() per BATCH_SIZE rules, with commits and progress notifications.
+
+# ── Configuration ────────────────────────────────────────────────────────────
+BATCH_SIZE = 500
+# ─────────────────────────────────────────────────────────────────────────────
 
 added_count = 0
+Item = env['product.pricelist.item']
 
 if model._name == 'product.pricelist':
-    for pricelist in records:
-        # Find rules applied on 'Product'
-        items_to_process = []
-        for i in pricelist.item_ids:
-            if i.applied_on == '1_product' and i.product_tmpl_id:
-                items_to_process.append(i)
-                
-        for item in items_to_process:
-            for variant in item.product_tmpl_id.product_variant_ids:
-                # Check if a similar rule already exists for this variant
-                existing = False
-                for rule in pricelist.item_ids:
-                    if rule.applied_on == '0_product_variant' and \
-                       rule.product_id == variant and \
-                       rule.min_quantity == item.min_quantity and \
-                       rule.date_start == item.date_start and \
-                       rule.date_end == item.date_end:
-                        existing = True
-                        break
-                
-                if not existing:
-                    # Copy the rule and apply it to the specific variant
-                    item.copy({
-                        'applied_on': '0_product_variant',
-                        'product_id': variant.id,
-                        'product_tmpl_id': item.product_tmpl_id.id,
-                    })
-                    added_count += 1
-            
+    # Find rules applied on 'Product' in all selected pricelists
+    items_to_process = Item.search([
+        ('pricelist_id', 'in', records.ids),
+        ('applied_on', '=', '1_product'),
+        ('product_tmpl_id', '!=', False),
+    ])
 elif model._name == 'product.pricelist.item':
     # Process selected rules directly
-    items_to_process = []
-    for i in records:
-        if i.applied_on == '1_product' and i.product_tmpl_id:
-            items_to_process.append(i)
-            
+    items_to_process = records.filtered(lambda i: i.applied_on == '1_product' and i.product_tmpl_id)
+else:
+    items_to_process = Item
+
+if items_to_process:
+    pricelist_ids = items_to_process.mapped('pricelist_id').ids
+    template_ids = items_to_process.mapped('product_tmpl_id').ids
+
+    # Index existing variant rules once: (pricelist, variant, min qty, date start, date end)
+    existing_keys = set()
+    for rule in Item.search_read([
+        ('pricelist_id', 'in', pricelist_ids),
+        ('applied_on', '=', '0_product_variant'),
+    ], ['pricelist_id', 'product_id', 'min_quantity', 'date_start', 'date_end']):
+        existing_keys.add((
+            rule['pricelist_id'][0],
+            rule['product_id'] and rule['product_id'][0],
+            rule['min_quantity'],
+            rule['date_start'],
+            rule['date_end'],
+        ))
+
+    # Variants of every template involved, in one read
+    variants_by_template = {}
+    for variant in env['product.product'].search_read([('product_tmpl_id', 'in', template_ids)], ['product_tmpl_id']):
+        variants_by_template.setdefault(variant['product_tmpl_id'][0], []).append(variant['id'])
+
+    # Values of the missing variant rules (same values item.copy() would use)
+    vals_list = []
     for item in items_to_process:
-        pricelist = item.pricelist_id
-        for variant in item.product_tmpl_id.product_variant_ids:
-            existing = False
-            for rule in pricelist.item_ids:
-                if rule.applied_on == '0_product_variant' and \
-                   rule.product_id == variant and \
-                   rule.min_quantity == item.min_quantity and \
-                   rule.date_start == item.date_start and \
-                   rule.date_end == item.date_end:
-                    existing = True
-                    break
-            
-            if not existing:
-                item.copy({
+        base_vals = None
+        for variant_id in variants_by_template.get(item.product_tmpl_id.id, []):
+            key = (item.pricelist_id.id, variant_id, item.min_quantity, item.date_start, item.date_end)
+            if key in existing_keys:
+                continue
+            existing_keys.add(key)
+            if base_vals is None:
+                base_vals = item.copy_data({
                     'applied_on': '0_product_variant',
-                    'product_id': variant.id,
                     'product_tmpl_id': item.product_tmpl_id.id,
-                })
-                added_count += 1
+                })[0]
+            vals = dict(base_vals)
+            vals['product_id'] = variant_id
+            vals_list.append(vals)
+
+    total_rules = len(vals_list)
+    for i in range(0, total_rules, BATCH_SIZE):
+        Item.create(vals_list[i:i + BATCH_SIZE])
+        added_count += len(vals_list[i:i + BATCH_SIZE])
+
+        # Commit to save progress and release locks
+        env.cr.commit()
+        env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
+            'title': 'Variant Rules Progress',
+            'message': f'Created {added_count}/{total_rules} variant rules...',
+            'type': 'info',
+            'sticky': False
+        })
 
 if added_count > 0:
     action = {
@@ -0,0 +1,181 @@
+# Odoo Server Action
+# Target Model: product.pricelist
+# Description: Reverse of Odoo_Pricelist_Add_Variant_Rules.py. Shrinks the
+#              pricelist rule table so price lookups (sales, POS) stay fast:
+#              1. Removes exact duplicate rules (same target, quantity, dates and pricing).
+#              2. Replaces variant-level (0_product_variant) rules that are identical
+#                 for ALL variants of a product with ONE product-level (1_product) rule.
+#
+# Usage:
+# Select pricelists (or none, for every pricelist) and run this action.
+# All rules are read once and grouped in a single pass. Rules are applied in the
+# order applied_on, min_quantity desc, id desc, so variant rules beat product rules
+# at any quantity. A group is therefore left alone when, over overlapping dates,
+# the template has another product rule with the same or a higher minimum
+# quantity (it would start winning) or another variant rule with the same or a
+# lower minimum quantity (it would stop losing). Quantity tiers collapse from the
+# lowest tier up, one tier per run.
+
+# ── Configuration ────────────────────────────────────────────────────────────
+BATCH_SIZE = 500
+# ─────────────────────────────────────────────────────────────────────────────
+
+Item = env['product.pricelist.item']
+
+if records and model._name == 'product.pricelist':
+    pricelist_ids = records.ids
+else:
+    pricelist_ids = env['product.pricelist'].search([]).ids
+
+# Pricing fields = every stored field except the rule's target and bookkeeping
+target_fields = ['pricelist_id', 'applied_on', 'product_id', 'product_tmpl_id', 'categ_id',
+                 'min_quantity', 'date_start', 'date_end']
+skip_fields = set(target_fields) | set(['id', 'sequence', 'create_uid', 'create_date', 'write_uid', 'write_date'])
+pricing_fields = sorted(name for name, info in Item.fields_get(attributes=['store']).items()
+                        if info.get('store') and name not in skip_fields)
+
+def dates_overlap(a, b):
+    """True when the validity periods of two rules share at least one moment."""
+    return ((not a['date_start'] or not b['date_end'] or a['date_start'] <= b['date_end'])
+            and (not b['date_start'] or not a['date_end'] or b['date_start'] <= a['date_end']))
+
+def field_key(value):
+    """Hashable, id-based form of a search_read value."""
+    if isinstance(value, list):
+        # many2one -> [id, name], x2many -> [ids]
+        if len(value) == 2 and isinstance(value[1], str):
+            return value[0]
+        return tuple(sorted(value))
+    return value
+
+# ── 1. Read every rule once ─────────────────────────────────────────────────
+rules = Item.search_read([('pricelist_id', 'in', pricelist_ids)], target_fields + pricing_fields, order='id')
+
+exact_groups = {}
+for rule in rules:
+    rule['signature'] = tuple(field_key(rule[f]) for f in pricing_fields)
+    key = (field_key(rule['pricelist_id']), rule['applied_on'], field_key(rule['product_id']),
+           field_key(rule['product_tmpl_id']), field_key(rule['categ_id']),
+           rule['min_quantity'], rule['date_start'], rule['date_end'], rule['signature'])
+    exact_groups.setdefault(key, []).append(rule)
+
+# Exact duplicates: keep the oldest rule of each group
+duplicate_ids = []
+kept_rules = []
+for group in exact_groups.values():
+    kept_rules.append(group[0])
+    duplicate_ids.extend(r['id'] for r in group[1:])
+
+# ── 2. Variant rules identical across every variant of a template ──────────
+variant_ids = list(set(r['product_id'][0] for r in kept_rules if r['applied_on'] == '0_product_variant' and r['product_id']))
+env.cr.execute("SELECT id, product_tmpl_id FROM product_product WHERE id = ANY(%s)", (variant_ids,))
+template_of = dict(env.cr.fetchall())
+env.cr.execute("""
+    SELECT product_tmpl_id, array_agg(id)
+      FROM product_product
+     WHERE active AND product_tmpl_id = ANY(%s)
+     GROUP BY product_tmpl_id
+""", (list(set(template_of.values())),))
+template_variants = dict((tmpl_id, set(ids)) for tmpl_id, ids in env.cr.fetchall())
+
+variant_groups = {}
+product_rules = {}
+# Every variant / product rule per (template, pricelist), for the priority checks
+template_variant_rules = {}
+template_product_rules = {}
+for rule in kept_rules:
+    base_key = (rule['pricelist_id'][0], rule['min_quantity'], rule['date_start'], rule['date_end'])
+    if rule['applied_on'] == '0_product_variant' and rule['product_id']:
+        tmpl_id = template_of.get(rule['product_id'][0])
+        variant_groups.setdefault((tmpl_id,) + base_key + (rule['signature'],), []).append(rule)
+        template_variant_rules.setdefault((tmpl_id, base_key[0]), []).append(rule)
+    elif rule['applied_on'] == '1_product' and rule['product_tmpl_id']:
+        product_rules.setdefault((rule['product_tmpl_id'][0],) + base_key, set()).add(rule['signature'])
+        template_product_rules.setdefault((rule['product_tmpl_id'][0], base_key[0]), []).append(rule)
+
+to_collapse = []   # (rule to copy or None when an identical product rule exists, variant rule ids)
+for key, group in variant_groups.items():
+    tmpl_id = key[0]
+    covered = set(r['product_id'][0] for r in group)
+    if not template_variants.get(tmpl_id) or not template_variants[tmpl_id] <= covered:
+        continue
+    existing_signatures = product_rules.get(key[:5], set())
+    if existing_signatures - set([key[5]]):
+        # A different product rule exists: the variant rules override it today
+        continue
+    sample = group[0]
+    group_ids = set(r['id'] for r in group)
+    if any(r['min_quantity'] >= sample['min_quantity'] and dates_overlap(r, sample)
+           and (r['signature'], r['min_quantity'], r['date_start'], r['date_end']) != (key[5],) + key[2:5]
+           for r in template_product_rules.get((tmpl_id, key[1]), [])):
+        # A product rule for larger quantities would take over from the collapsed rule
+        continue
+    if any(r['id'] not in group_ids and r['min_quantity'] <= sample['min_quantity'] and dates_overlap(r, sample)
+           for r in template_variant_rules.get((tmpl_id, key[1]), [])):
+        # Another variant rule loses to this group today but would beat a product rule
+        continue
+    template_rule = None if key[5] in existing_signatures else group[0]
+    to_collapse.append((tmpl_id, template_rule, [r['id'] for r in group]))
+
+# ── 3. Apply: one create and one unlink per batch ───────────────────────────
+collapsed_rule_count = 0
+created_count = 0
+for i in range(0, len(to_collapse), BATCH_SIZE):
+    batch = to_collapse[i:i + BATCH_SIZE]
+    vals_list = []
+    remove_ids = []
+    for tmpl_id, template_rule, rule_ids in batch:
+        if template_rule:
+            vals = Item.browse(template_rule['id']).copy_data({
+                'applied_on': '1_product',
+                'product_id': False,
+                'product_tmpl_id': tmpl_id,
+            })[0]
+            vals_list.append(vals)
+        remove_ids.extend(rule_ids)
+    if vals_list:
+        Item.create(vals_list)
+    Item.browse(remove_ids).unlink()
+    created_count += len(vals_list)
+    collapsed_rule_count += len(remove_ids)
+
+    # Commit to save progress and release locks
+    env.cr.commit()
+    env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
+        'title': 'Pricelist Compaction Progress',
+        'message': f'Collapsed {min(i + BATCH_SIZE, len(to_collapse))}/{len(to_collapse)} variant rule groups...',
+        'type': 'info',
+        'sticky': False
+    })
+
+for i in range(0, len(duplicate_ids), BATCH_SIZE):
+    Item.browse(duplicate_ids[i:i + BATCH_SIZE]).unlink()
+    env.cr.commit()
+
+removed_total = collapsed_rule_count + len(duplicate_ids) - created_count
+log(f"Pricelist compaction: {len(duplicate_ids)} duplicate rules removed, {collapsed_rule_count} variant rules "
+    f"collapsed into {created_count} product rules.", level='info')
+
+if removed_total > 0:
+    action = {
+        'type': 'ir.actions.client',
+        'tag': 'display_notification',
+        'params': {
+            'title': 'Pricelist Compacted',
+            'message': f'Removed {len(duplicate_ids)} duplicate rules and collapsed {collapsed_rule_count} variant rules '
+                       f'into {created_count} product rules ({removed_total} fewer rules).',
+            'type': 'success',
+            'sticky': False,
+        }
+    }
+else:
+    action = {
+        'type': 'ir.actions.client',
+        'tag': 'display_notification',
+        'params': {
+            'title': 'No Actions Taken',
+            'message': 'No duplicate rules or variant rules shared by all variants were found.',
+            'type': 'info',
+            'sticky': False,
+        }
+    }
@@ -0,0 +1,308 @@
+# Odoo Server Action (or Scheduled Action)
+# Target Model: product.pricelist
+# Description: Maintains a precomputed price table
+#              (pricelist, variant, min quantity, date range) -> price
+#              so POS and integrations read final prices with ONE indexed lookup
+#              instead of running the pricelist rule engine per product per request.
+#
+# Rows:
+# - one row per variant-level rule (0_product_variant, e.g. created by
+#   Odoo_Pricelist_Add_Variant_Rules.py), priced at its min quantity and date range
+# - optionally one base row (min quantity 0, no dates) per saleable variant
+#
+# Refresh:
+# The first run (or FULL_REFRESH) computes everything. Later runs only recompute
+# what changed since the stored watermark: rules written since then or whose date
+# range started or ended since then (a category or global rule, or a deleted rule,
+# refreshes its whole pricelist), products whose prices or attribute extras
+# changed, pricelists in a foreign currency after a rate change, and pricelists
+# based on a refreshed pricelist. Changes are scanned from the watermark minus
+# WATERMARK_OVERLAP_MINUTES, so rows committed late by long transactions are
+# picked up on the next run. Prices are
+# computed with one _get_products_price() call per (pricelist, quantity, date)
+# batch of products. Run it from a Scheduled Action to keep the table fresh.
+#
+# Lookup:
+#   SELECT price FROM hsx_pricelist_price
+#    WHERE pricelist_id = %s AND product_id = %s AND min_quantity <= %s
+#      AND (date_start IS NULL OR date_start <= now())
+#      AND (date_end IS NULL OR date_end >= now())
+#    ORDER BY min_quantity DESC LIMIT 1
+
+# ── Configuration ────────────────────────────────────────────────────────────
+# Pricelists to materialize (empty = every active pricelist)
+PRICELIST_IDS = []
+# Also store a base row (min quantity 0, no dates) for every saleable variant
+INCLUDE_BASE_PRICES = True
+# Products priced per _get_products_price() call
+BATCH_SIZE = 500
+# Recompute everything instead of only what changed
+FULL_REFRESH = False
+WATERMARK_PARAM = 'hsx_pricelist_price.watermark'
+# Changes are re-scanned this far behind the watermark (late-committed transactions)
+WATERMARK_OVERLAP_MINUTES = 15
+# ─────────────────────────────────────────────────────────────────────────────
+
+env.cr.execute("""
+    CREATE TABLE IF NOT EXISTS hsx_pricelist_price (
+        pricelist_id integer NOT NULL,
+        product_id integer NOT NULL,
+        min_quantity double precision NOT NULL DEFAULT 0,
+        date_start timestamp,
+        date_end timestamp,
+        price double precision,
+        computed_at timestamp NOT NULL DEFAULT (now() AT TIME ZONE 'UTC')
+    )
+""")
+env.cr.execute("CREATE INDEX IF NOT EXISTS hsx_pricelist_price_lookup_idx ON hsx_pricelist_price (pricelist_id, product_id, min_quantity)")
+env.cr.execute("""
+    CREATE TABLE IF NOT EXISTS hsx_pricelist_price_state (
+        pricelist_id integer PRIMARY KEY,
+        item_count integer NOT NULL
+    )
+""")
+
+ICP = env['ir.config_parameter'].sudo()
+watermark = ICP.get_param(WATERMARK_PARAM)
+env.cr.execute("SELECT now() AT TIME ZONE 'UTC'")
+run_start = env.cr.fetchone()[0]
+full_refresh = FULL_REFRESH or not watermark
+
+if PRICELIST_IDS:
+    pricelist_ids = env['product.pricelist'].browse(PRICELIST_IDS).exists().ids
+else:
+    pricelist_ids = env['product.pricelist'].search([]).ids
+if not pricelist_ids:
+    raise UserError("No pricelist to materialize.")
+
+# ── 1. Rule rows: {(pricelist, product): set((min_qty, date_start, date_end))} ──
+desired = {}
+env.cr.execute("""
+    SELECT i.pricelist_id, i.product_id, i.min_quantity::float, i.date_start, i.date_end
+      FROM product_pricelist_item i
+      JOIN product_product pp ON pp.id = i.product_id AND pp.active
+     WHERE i.applied_on = '0_product_variant' AND i.pricelist_id = ANY(%s)
+""", (pricelist_ids,))
+for pricelist_id, product_id, min_qty, date_start, date_end in env.cr.fetchall():
+    desired.setdefault((pricelist_id, product_id), set()).add((min_qty or 0.0, date_start, date_end))
+
+env.cr.execute("""
+    SELECT pp.id, pp.product_tmpl_id
+      FROM product_product pp
+      JOIN product_template pt ON pt.id = pp.product_tmpl_id
+     WHERE pp.active AND pt.active AND pt.sale_ok
+""")
+variants_by_template = {}
+saleable_ids = []
+for product_id, tmpl_id in env.cr.fetchall():
+    variants_by_template.setdefault(tmpl_id, []).append(product_id)
+    saleable_ids.append(product_id)
+
+# ── 2. What changed since the watermark ─────────────────────────────────────
+full_pricelists = set(pricelist_ids) if full_refresh else set()
+dirty_pairs = set()
+dirty_products = set()
+
+env.cr.execute("""
+    SELECT pricelist_id, count(*), count(*) FILTER (WHERE create_date > %s)
+      FROM product_pricelist_item
+     WHERE pricelist_id = ANY(%s)
+     GROUP BY pricelist_id
+""", (watermark or run_start, pricelist_ids))
+item_counts = {}
+new_item_counts = {}
+for pricelist_id, item_count, new_count in env.cr.fetchall():
+    item_counts[pricelist_id] = item_count
+    new_item_counts[pricelist_id] = new_count
+
+if not full_refresh:
+    # Rules deleted since the last run: fewer rules than stored + created
+    env.cr.execute("SELECT pricelist_id, item_count FROM hsx_pricelist_price_state WHERE pricelist_id = ANY(%s)", (pricelist_ids,))
+    stored_counts = dict(env.cr.fetchall())
+    for pricelist_id in pricelist_ids:
+        if pricelist_id not in stored_counts:
+            full_pricelists.add(pricelist_id)
+        elif item_counts.get(pricelist_id, 0) - new_item_counts.get(pricelist_id, 0) < stored_counts[pricelist_id]:
+            full_pricelists.add(pricelist_id)
+
+    env.cr.execute("SELECT %s::timestamp - make_interval(mins => %s)", (watermark, WATERMARK_OVERLAP_MINUTES))
+    scan_from = env.cr.fetchone()[0]
+
+    # Rules written since the last run, or that started / expired since then
+    env.cr.execute("""
+        SELECT pricelist_id, applied_on, product_id, product_tmpl_id
+          FROM product_pricelist_item
+         WHERE pricelist_id = ANY(%s)
+           AND (write_date > %s
+                OR (date_start > %s AND date_start <= %s)
+                OR (date_end > %s AND date_end <= %s))
+    """, (pricelist_ids, scan_from, scan_from, run_start, scan_from, run_start))
+    for pricelist_id, applied_on, product_id, tmpl_id in env.cr.fetchall():
+        if applied_on == '0_product_variant' and product_id:
+            dirty_pairs.add((pricelist_id, product_id))
+        elif applied_on == '1_product' and tmpl_id:
+            for variant_id in variants_by_template.get(tmpl_id, []):
+                dirty_pairs.add((pricelist_id, variant_id))
+        else:
+            full_pricelists.add(pricelist_id)
+
+    # Products whose prices (list price, cost, attribute extras) changed
+    env.cr.execute("""
+        SELECT pp.id
+          FROM product_product pp
+          JOIN product_template pt ON pt.id = pp.product_tmpl_id
+         WHERE pp.write_date > %s OR pt.write_date > %s
+        UNION
+        SELECT pp.id
+          FROM product_product pp
+          JOIN product_template_attribute_value v ON v.product_tmpl_id = pp.product_tmpl_id
+         WHERE v.write_date > %s
+    """, (scan_from, scan_from, scan_from))
+    dirty_products = set(r[0] for r in env.cr.fetchall())
+
+    # Pricelists in another currency than their company, after a rate was written
+    # or a dated rate took effect
+    env.cr.execute("""
+        SELECT pl.id
+          FROM product_pricelist pl
+          JOIN res_company c ON c.id = COALESCE(pl.company_id, %s)
+         WHERE pl.id = ANY(%s) AND pl.currency_id != c.currency_id
+           AND EXISTS (
+                   SELECT 1 FROM res_currency_rate r
+                    WHERE r.currency_id IN (pl.currency_id, c.currency_id)
+                      AND (r.write_date > %s OR (r.name > %s::date AND r.name <= %s::date))
+               )
+    """, (env.company.id, pricelist_ids, scan_from, scan_from, run_start))
+    full_pricelists.update(r[0] for r in env.cr.fetchall())
+
+    # Pricelists based on another pricelist inherit its changes
+    env.cr.execute("""
+        SELECT DISTINCT base_pricelist_id, pricelist_id
+          FROM product_pricelist_item
+         WHERE base = 'pricelist' AND base_pricelist_id IS NOT NULL AND pricelist_id = ANY(%s)
+    """, (pricelist_ids,))
+    dependents = {}
+    for base_id, pricelist_id in env.cr.fetchall():
+        if base_id != pricelist_id:
+            dependents.setdefault(base_id, set()).add(pricelist_id)
+
+    pending = list(full_pricelists)
+    while pending:
+        base_id = pending.pop()
+        for pricelist_id in dependents.get(base_id, set()):
+            if pricelist_id not in full_pricelists:
+                full_pricelists.add(pricelist_id)
+                pending.append(pricelist_id)
+
+    pending = list(dirty_pairs)
+    while pending:
+        base_id, product_id = pending.pop()
+        for pricelist_id in dependents.get(base_id, set()):
+            if (pricelist_id, product_id) not in dirty_pairs:
+                dirty_pairs.add((pricelist_id, product_id))
+                pending.append((pricelist_id, product_id))
+
+def needs_refresh(pair):
+    return pair[0] in full_pricelists or pair in dirty_pairs or pair[1] in dirty_products
+
+# ── 3. Group the rows to compute by (pricelist, min qty, date range) ────────
+tasks = {}
+for pair, keys in desired.items():
+    if not needs_refresh(pair):
+        continue
+    for min_qty, date_start, date_end in keys:
+        tasks.setdefault((pair[0], min_qty, date_start, date_end), []).append(pair[1])
+
+# Base rows are not held per pair: every saleable variant of each pricelist
+if INCLUDE_BASE_PRICES:
+    for pricelist_id in pricelist_ids:
+        base_products = tasks.setdefault((pricelist_id, 0.0, None, None), [])
+        # A variant rule may already define the same (0, no dates) row
+        already_listed = set(base_products)
+        base_products.extend(p for p in saleable_ids
+                             if p not in already_listed and needs_refresh((pricelist_id, p)))
+
+batches = []
+for task_key, product_ids in tasks.items():
+    product_ids.sort()
+    for i in range(0, len(product_ids), BATCH_SIZE):
+        batches.append((task_key, product_ids[i:i + BATCH_SIZE]))
+
+total_batches = len(batches)
+row_count = 0
+Product = env['product.product']
+pricelists = dict((p.id, p) for p in env['product.pricelist'].browse(pricelist_ids))
+
+log(f"Materialized prices: {len(full_pricelists)} full pricelist(s), {total_batches} batch(es) to compute.", level='info')
+
+for n, (task_key, product_ids) in enumerate(batches):
+    pricelist_id, min_qty, date_start, date_end = task_key
+    # Price at the rule's quantity, on a date inside its validity window
+    if date_start:
+        eval_date = date_start
+    elif date_end and date_end < run_start:
+        eval_date = date_end
+    else:
+        eval_date = run_start
+    prices = pricelists[pricelist_id]._get_products_price(Product.browse(product_ids), max(min_qty, 1.0), date=eval_date)
+
+    # Replace exactly these rows, in the same transaction as their new values
+    env.cr.execute("""
+        DELETE FROM hsx_pricelist_price
+         WHERE pricelist_id = %s AND product_id = ANY(%s) AND min_quantity = %s
+           AND date_start IS NOT DISTINCT FROM %s AND date_end IS NOT DISTINCT FROM %s
+    """, (pricelist_id, product_ids, min_qty, date_start, date_end))
+    env.cr.execute("""
+        INSERT INTO hsx_pricelist_price (pricelist_id, product_id, min_quantity, date_start, date_end, price)
+        SELECT %s, unnest(%s::integer[]), %s, %s::timestamp, %s::timestamp, unnest(%s::double precision[])
+    """, (pricelist_id, product_ids, min_qty, date_start, date_end, [prices.get(p, 0.0) for p in product_ids]))
+    row_count += len(product_ids)
+
+    if (n + 1) % 20 == 0 or n + 1 == total_batches:
+        # Commit to save progress and release locks
+        env.cr.commit()
+        env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
+            'title': 'Price Table Progress',
+            'message': f'Computed {n + 1}/{total_batches} batches ({row_count} prices)...',
+            'type': 'info',
+            'sticky': False
+        })
+
+# ── 4. Drop stale rows of everything refreshed, store state and watermark ───
+if full_refresh:
+    env.cr.execute("DELETE FROM hsx_pricelist_price WHERE NOT (pricelist_id = ANY(%s))", (pricelist_ids,))
+env.cr.execute("""
+    DELETE FROM hsx_pricelist_price
+     WHERE computed_at < %s
+       AND (pricelist_id = ANY(%s) OR product_id = ANY(%s))
+""", (run_start, list(full_pricelists), list(dirty_products)))
+dirty_pair_list = list(dirty_pairs)
+env.cr.execute("""
+    DELETE FROM hsx_pricelist_price t
+     USING unnest(%s::integer[], %s::integer[]) AS d(pricelist_id, product_id)
+     WHERE t.pricelist_id = d.pricelist_id AND t.product_id = d.product_id AND t.computed_at < %s
+""", ([p[0] for p in dirty_pair_list], [p[1] for p in dirty_pair_list], run_start))
+
+for pricelist_id in pricelist_ids:
+    env.cr.execute("""
+        INSERT INTO hsx_pricelist_price_state (pricelist_id, item_count) VALUES (%s, %s)
+        ON CONFLICT (pricelist_id) DO UPDATE SET item_count = EXCLUDED.item_count
+    """, (pricelist_id, item_counts.get(pricelist_id, 0)))
+ICP.set_param(WATERMARK_PARAM, str(run_start))
+env.cr.commit()
+
+action = {
+    'type': 'ir.actions.client',
+    'tag': 'display_notification',
+    'params': {
+        'title': 'Price Table Refreshed',
+        'message': f'{row_count} prices computed' + (' (full refresh).' if full_refresh else
+                   f' ({len(full_pricelists)} full pricelist(s), {len(dirty_pairs)} rule changes, {len(dirty_products)} product changes).'),
+        'type': 'success',
+        'sticky': False,
+    }
+}
+
+## Incremental Watermark Refresh
+## Batched Price Computation
+## Powered By HSx Tech - Ali Muzafar
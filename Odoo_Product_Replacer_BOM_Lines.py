@@ -4,8 +4,10 @@
 #
 # Usage:
 # 1. Select records in any of the supported list views.
-# 2. Update REPLACEMENT_MAP below with {OLD_ID: NEW_ID} pairs.
-# 3. Run this action from the Action menu.
+# 2. Update REPLACEMENT_MAP below with {OLD_ID: NEW_ID} pairs
+#    (or upload a CSV with thousands of pairs and set REPLACEMENT_CSV_ATTACHMENT_ID).
+# 3. Optionally run once with PREVIEW_ONLY = True to get the impact report first.
+# 4. Run this action from the Action menu.
 
 # ── Configuration ────────────────────────────────────────────────────────────
 
@@ -15,11 +17,33 @@ REPLACEMENT_MAP = {
     # 0: 0, 
 }
 
+# Optional: ID of an ir.attachment (CSV, one "old_id,new_id" pair per row, header allowed).
+# Its pairs are merged into REPLACEMENT_MAP.
+REPLACEMENT_CSV_ATTACHMENT_ID = False
+
+# Impact preview: report every BOM using the old products (whole database,
+# no selection needed) without changing anything.
+PREVIEW_ONLY = False
+
 # Number of records to process per database transaction
 BATCH_SIZE = 100
 
 # ── End Configuration ─────────────────────────────────────────────────────────
 
+if REPLACEMENT_CSV_ATTACHMENT_ID:
+    attachment = env['ir.attachment'].browse(REPLACEMENT_CSV_ATTACHMENT_ID)
+    if not attachment.exists():
+        raise UserError(f"Attachment with ID {REPLACEMENT_CSV_ATTACHMENT_ID} not found.")
+    csv_pairs = 0
+    for row in attachment.raw.decode('utf-8-sig').splitlines():
+        cells = [c.strip().strip('"') for c in row.replace(';', ',').split(',')]
+        # Skip header / empty / malformed rows
+        if len(cells) < 2 or not cells[0].isdigit() or not cells[1].isdigit():
+            continue
+        REPLACEMENT_MAP[int(cells[0])] = int(cells[1])
+        csv_pairs += 1
+    log(f"Loaded {csv_pairs} replacement pairs from attachment {attachment.name}.", level='info')
+
 if not REPLACEMENT_MAP:
     raise UserError("Please configure REPLACEMENT_MAP in the script.")
 
@@ -29,174 +53,247 @@ def resolve_products(input_ids):
         '|', ('id', 'in', list(input_ids)), ('product_tmpl_id', 'in', list(input_ids))
     ])
 
-# Resolve all products involved in the mappings
-all_v = resolve_products(set(REPLACEMENT_MAP.keys()) | set(REPLACEMENT_MAP.values()))
+# Resolve all products involved in the mappings in ONE read, then index them:
+# variant id -> template id, and template id -> [variant ids]
+all_input_ids = list(set(REPLACEMENT_MAP.keys()) | set(REPLACEMENT_MAP.values()))
+all_v = env['product.product'].with_context(active_test=False).search_read([
+    '|', ('id', 'in', all_input_ids), ('product_tmpl_id', 'in', all_input_ids)
+], ['product_tmpl_id', 'uom_id'], order='id asc')
 
-# Create a mapping of [Old Variant ID] -> [New Variant Record]
+variant_ids = set()
+variants_by_template = {}
+variant_uom = {}
+for v in all_v:
+    variant_ids.add(v['id'])
+    variants_by_template.setdefault(v['product_tmpl_id'][0], []).append(v['id'])
+    variant_uom[v['id']] = v['uom_id'][0]
+
+def matching_variants(input_id):
+    """Variants matching an ID used as a Variant ID and/or as a Template ID."""
+    matches = list(variants_by_template.get(input_id, []))
+    if input_id in variant_ids and input_id not in matches:
+        matches.insert(0, input_id)
+    return matches
+
+# Create a mapping of [Old Variant ID] -> [New Variant ID]
 final_mapping = {}
 for old_id, new_id in REPLACEMENT_MAP.items():
-    match_old = all_v.filtered(lambda p: p.id == old_id or p.product_tmpl_id.id == old_id)
-    match_new = all_v.filtered(lambda p: p.id == new_id or p.product_tmpl_id.id == new_id)
-    
+    match_new = matching_variants(new_id)
     if not match_new:
         raise UserError(f"Target Product ID {new_id} not found as a Variant or Template.")
-    
+
+    # An exact Variant ID wins, otherwise the template's first variant
     target_new = match_new[0]
-    for ov in match_old:
-        final_mapping[ov.id] = target_new
+    for ov in matching_variants(old_id):
+        final_mapping[ov] = target_new
 
 if not final_mapping:
     raise UserError("Could not resolve any IDs from REPLACEMENT_MAP to valid products.")
 
+# Where-used index built in ONE query: old component -> BOM ids using it
+env.cr.execute("""
+    SELECT product_id, array_agg(DISTINCT bom_id), count(*)
+      FROM mrp_bom_line
+     WHERE product_id = ANY(%s)
+     GROUP BY product_id
+""", (list(final_mapping.keys()),))
+where_used = {}
+where_used_lines = {}
+for product_id, bom_ids, line_count in env.cr.fetchall():
+    where_used[product_id] = bom_ids
+    where_used_lines[product_id] = line_count
+
+# Names for reporting, resolved once for every product and BOM involved
+def product_names(ids):
+    return {p['id']: p['display_name'] for p in env['product.product'].with_context(active_test=False).browse(list(ids)).read(['display_name'])}
+
+def bom_fg_names(ids):
+    # Use our variant-aware naming logic
+    names = {}
+    for b in env['mrp.bom'].with_context(active_test=False).browse(list(ids)).read(['product_id', 'product_tmpl_id']):
+        names[b['id']] = b['product_id'][1] if b['product_id'] else b['product_tmpl_id'][1]
+    return names
+
 # Detect selection context (Model and IDs)
 active_model = env.context.get('active_model')
 active_ids = env.context.get('active_ids', [])
 
-if not active_ids:
-    raise UserError("Please select at least one record to update.")
-
-# Build search domain for BOM lines
-line_domain = []
-
-if active_model == 'mrp.bom':
-    line_domain = [('bom_id', 'in', active_ids), ('product_id', 'in', list(final_mapping.keys()))]
-elif active_model == 'mrp.bom.line':
-    line_domain = [('id', 'in', active_ids), ('product_id', 'in', list(final_mapping.keys()))]
-elif active_model in ['product.product', 'product.template']:
-    selected_variants = resolve_products(active_ids)
-    target_variant_ids = [v.id for v in selected_variants if v.id in final_mapping]
-    if not target_variant_ids:
-        raise UserError("None of the selected products/variants are in your REPLACEMENT_MAP.")
-    line_domain = [('product_id', 'in', target_variant_ids)]
-else:
-    line_domain = [('id', 'in', active_ids), ('product_id', 'in', list(final_mapping.keys()))]
-
-# Search for relevant lines
-to_update_lines = env['mrp.bom.line'].with_context(active_test=False).search(line_domain)
-
-total_lines = len(to_update_lines)
-if total_lines == 0:
-    action = {
-        'type': 'ir.actions.client',
-        'tag': 'display_notification',
-        'params': {
-            'title': 'No Matching Lines Found',
-            'message': f"The selection does not contain any matching products in the BOM lines.",
-            'type': 'warning',
-            'sticky': True,
-        }
-    }
-else:
-    log(f"Starting advanced replacement on {active_model} for {total_lines} lines...", level='info')
-
-    updated_count = 0
-    # Grouping to track which BOMs were updated for which replacement
-    # Format: {(old_v_id, new_v_id): set(bom_names)}
-    group_report = {}
-
-    for i in range(0, total_lines, BATCH_SIZE):
-        batch = to_update_lines[i:i + BATCH_SIZE]
-        groups = {}
-        for line in batch:
-            old_p_id = line.product_id.id
-            new_p = final_mapping.get(old_p_id)
-            if new_p:
-                # Track for reporting
-                pair = (old_p_id, new_p.id)
-                if pair not in group_report:
-                    group_report[pair] = set()
-                
-                # Store the Parent BOM ID for reporting
-                group_report[pair].add(line.bom_id.id)
-
-                # Batch write grouping
-                if new_p.id not in groups:
-                    groups[new_p.id] = {'record': new_p, 'ids': []}
-                groups[new_p.id]['ids'].append(line.id)
-
-        for p_id, info in groups.items():
-            env['mrp.bom.line'].browse(info['ids']).write({
-                'product_id': p_id,
-                'product_uom_id': info['record'].uom_id.id
-            })
-            updated_count += len(info['ids'])
-
-        env.cr.commit()
-
-        # Real-time progress progress via bus
-        progress = min(i + BATCH_SIZE, total_lines)
-        env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
-            'title': 'Replacement Progress',
-            'message': f'Processed {progress}/{total_lines} lines...',
-            'type': 'info',
-            'sticky': False,
-        })
-
-    # Prepare Detailed Grouped Summary and Activity Note
-    summary_parts = [f"Successfully updated {updated_count} line(s).\n"]
-    note_html_parts = [f"<p>Successfully updated <b>{updated_count}</b> line(s).</p>"]
-    
-    unique_boms_all = set()
-
-    for (old_id, new_id), b_ids in group_report.items():
-        old_prod = env['product.product'].browse(old_id)
-        new_prod = env['product.product'].browse(new_id)
-        unique_boms_all.update(b_ids)
-        
-        # Resolve BOM names for this group
-        boms_in_group = env['mrp.bom'].browse(list(b_ids))
-        # Use our variant-aware naming logic
-        bom_names_in_group = []
-        for b in boms_in_group:
-            bom_names_in_group.append(b.product_id.display_name if b.product_id else b.product_tmpl_id.display_name)
-        
-        bom_names_in_group = sorted(list(set(bom_names_in_group)))
-        
-        # Build text summary
-        summary_parts.append(f"{old_prod.display_name} ➔ {new_prod.display_name}")
-        summary_parts.extend([f"  • {n}" for n in bom_names_in_group[:5]])
-        if len(bom_names_in_group) > 5:
-            summary_parts.append(f"  ... and {len(bom_names_in_group)-5} more")
-        summary_parts.append("") # Blank line
-        
-        # Build HTML activity note
-        bom_list_html = "".join([f"<li>{n}</li>" for n in bom_names_in_group])
+if PREVIEW_ONLY:
+    # Impact preview straight from the where-used index, nothing is written
+    preview_bom_ids = set()
+    for bom_ids in where_used.values():
+        preview_bom_ids.update(bom_ids)
+    names = product_names(set(final_mapping.keys()) | set(final_mapping.values()))
+    fg_names = bom_fg_names(preview_bom_ids)
+
+    total_pairs = len([old_id for old_id in final_mapping if old_id in where_used])
+    total_preview_lines = sum(where_used_lines.values())
+    note_html_parts = [f"<p><b>{total_pairs}</b> replacement(s) would change <b>{total_preview_lines}</b> line(s) "
+                       f"in <b>{len(preview_bom_ids)}</b> BOM(s).</p>"]
+    for old_id, new_id in final_mapping.items():
+        if old_id not in where_used:
+            continue
+        bom_names = sorted(set(fg_names[b] for b in where_used[old_id]))
+        bom_list_html = "".join([f"<li>{n}</li>" for n in bom_names])
         note_html_parts.append(
-            f"<h4>{old_prod.display_name} ➔ {new_prod.display_name}</h4>"
+            f"<h4>{names.get(old_id)} ➔ {names.get(new_id)} ({where_used_lines[old_id]} line(s))</h4>"
             f"<ul>{bom_list_html}</ul>"
         )
+    note_html = "".join(note_html_parts) + "<p><i>Impact preview via HST Advanced BOM Replacer. No changes were made.</i></p>"
 
-    summary = "\n".join(summary_parts)
-    note_html = "".join(note_html_parts) + f"<p><i>Processed via HST Advanced BOM Replacer on {active_model}.</i></p>"
-
-    # Activity Creation
-    if unique_boms_all:
-        type_todo = env.ref('mail.mail_activity_data_todo', raise_if_not_found=False) or env['mail.activity.type'].search([], limit=1)
-        mrp_bom_model = env['ir.model'].search([('model', '=', 'mrp.bom')], limit=1)
-        
-        # Attach activity to the first found BOM ID in the entire process
-        first_bom_id = list(unique_boms_all)[0]
-        target_bom = env['mrp.bom'].browse(first_bom_id)
-        
-        if target_bom:
-            env['mail.activity'].create({
-                'res_id': target_bom.id,
-                'res_model_id': mrp_bom_model.id,
-                'activity_type_id': type_todo.id,
-                'summary': 'BOM Product Replacement Grouped Summary',
-                'note': note_html,
-                'user_id': env.user.id,
-            })
-            summary += "\n\nAn Activity has been created with the full grouped report."
-    
-    log(summary, level='info')
+    res_partner_model = env['ir.model'].search([('model', '=', 'res.partner')], limit=1)
+    type_todo = env.ref('mail.mail_activity_data_todo', raise_if_not_found=False) or env['mail.activity.type'].search([], limit=1)
+    env['mail.activity'].create({
+        'res_id': env.user.partner_id.id,
+        'res_model_id': res_partner_model.id,
+        'activity_type_id': type_todo.id,
+        'summary': f'BOM Product Replacement Impact Preview: {len(preview_bom_ids)} BOM(s)',
+        'note': note_html,
+        'user_id': env.user.id,
+    })
 
     action = { 'type': 'ir.actions.client', 'tag': 'display_notification', 'params': {
-        'title': 'Replacement Complete', 'message': summary, 'type': 'success', 'sticky': True,
+        'title': 'Replacement Impact Preview',
+        'message': f"{total_pairs} replacement(s) would change {total_preview_lines} line(s) in {len(preview_bom_ids)} BOM(s). Check your activity!",
+        'type': 'info', 'sticky': True,
     }}
 
+else:
+    if not active_ids:
+        raise UserError("Please select at least one record to update.")
+
+    # Build search domain for BOM lines (only components that are actually used somewhere)
+    used_old_ids = list(where_used.keys())
+    line_domain = []
+
+    if active_model == 'mrp.bom':
+        line_domain = [('bom_id', 'in', active_ids), ('product_id', 'in', used_old_ids)]
+    elif active_model == 'mrp.bom.line':
+        line_domain = [('id', 'in', active_ids), ('product_id', 'in', used_old_ids)]
+    elif active_model in ['product.product', 'product.template']:
+        selected_variants = resolve_products(active_ids)
+        target_variant_ids = [v.id for v in selected_variants if v.id in final_mapping]
+        if not target_variant_ids:
+            raise UserError("None of the selected products/variants are in your REPLACEMENT_MAP.")
+        line_domain = [('product_id', 'in', target_variant_ids)]
+    else:
+        line_domain = [('id', 'in', active_ids), ('product_id', 'in', used_old_ids)]
+
+    # Search for relevant lines
+    to_update_lines = env['mrp.bom.line'].with_context(active_test=False).search_read(line_domain, ['product_id', 'bom_id'])
+
+    total_lines = len(to_update_lines)
+    if total_lines == 0:
+        action = {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'No Matching Lines Found',
+                'message': f"The selection does not contain any matching products in the BOM lines.",
+                'type': 'warning',
+                'sticky': True,
+            }
+        }
+    else:
+        log(f"Starting advanced replacement on {active_model} for {total_lines} lines...", level='info')
+
+        updated_count = 0
+        # Grouping to track which BOMs were updated for which replacement
+        # Format: {(old_v_id, new_v_id): set(bom_ids)}
+        group_report = {}
+
+        for i in range(0, total_lines, BATCH_SIZE):
+            batch = to_update_lines[i:i + BATCH_SIZE]
+            groups = {}
+            for line in batch:
+                old_p_id = line['product_id'][0]
+                new_p_id = final_mapping.get(old_p_id)
+                if new_p_id:
+                    # Track for reporting: store the Parent BOM ID
+                    group_report.setdefault((old_p_id, new_p_id), set()).add(line['bom_id'][0])
+
+                    # Batch write grouping
+                    groups.setdefault(new_p_id, []).append(line['id'])
+
+            for p_id, line_ids in groups.items():
+                env['mrp.bom.line'].browse(line_ids).write({
+                    'product_id': p_id,
+                    'product_uom_id': variant_uom[p_id]
+                })
+                updated_count += len(line_ids)
+
+            env.cr.commit()
+
+            # Real-time progress progress via bus
+            progress = min(i + BATCH_SIZE, total_lines)
+            env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
+                'title': 'Replacement Progress',
+                'message': f'Processed {progress}/{total_lines} lines...',
+                'type': 'info',
+                'sticky': False,
+            })
+
+        # Prepare Detailed Grouped Summary and Activity Note
+        summary_parts = [f"Successfully updated {updated_count} line(s).\n"]
+        note_html_parts = [f"<p>Successfully updated <b>{updated_count}</b> line(s).</p>"]
+
+        unique_boms_all = set()
+        for b_ids in group_report.values():
+            unique_boms_all.update(b_ids)
+
+        # Resolve every product and BOM name once for the whole report
+        names = product_names(set(p for pair in group_report for p in pair))
+        fg_names = bom_fg_names(unique_boms_all)
+
+        for (old_id, new_id), b_ids in group_report.items():
+            bom_names_in_group = sorted(set(fg_names[b] for b in b_ids))
+
+            # Build text summary
+            summary_parts.append(f"{names.get(old_id)} ➔ {names.get(new_id)}")
+            summary_parts.extend([f"  • {n}" for n in bom_names_in_group[:5]])
+            if len(bom_names_in_group) > 5:
+                summary_parts.append(f"  ... and {len(bom_names_in_group)-5} more")
+            summary_parts.append("") # Blank line
+
+            # Build HTML activity note
+            bom_list_html = "".join([f"<li>{n}</li>" for n in bom_names_in_group])
+            note_html_parts.append(
+                f"<h4>{names.get(old_id)} ➔ {names.get(new_id)}</h4>"
+                f"<ul>{bom_list_html}</ul>"
+            )
+
+        summary = "\n".join(summary_parts)
+        note_html = "".join(note_html_parts) + f"<p><i>Processed via HST Advanced BOM Replacer on {active_model}.</i></p>"
+
+        # Activity Creation
+        if unique_boms_all:
+            type_todo = env.ref('mail.mail_activity_data_todo', raise_if_not_found=False) or env['mail.activity.type'].search([], limit=1)
+            mrp_bom_model = env['ir.model'].search([('model', '=', 'mrp.bom')], limit=1)
+
+            # Attach activity to the first found BOM ID in the entire process
+            first_bom_id = list(unique_boms_all)[0]
+            target_bom = env['mrp.bom'].browse(first_bom_id)
+
+            if target_bom:
+                env['mail.activity'].create({
+                    'res_id': target_bom.id,
+                    'res_model_id': mrp_bom_model.id,
+                    'activity_type_id': type_todo.id,
+                    'summary': 'BOM Product Replacement Grouped Summary',
+                    'note': note_html,
+                    'user_id': env.user.id,
+                })
+                summary += "\n\nAn Activity has been created with the full grouped report."
+
+        log(summary, level='info')
+
+        action = { 'type': 'ir.actions.client', 'tag': 'display_notification', 'params': {
+            'title': 'Replacement Complete', 'message': summary, 'type': 'success', 'sticky': True,
+        }}
+
 ## Model Context Support (BOM/Lines/Product/Variants)
 ## Automatic Template-to-Variant Resolution
+## Where-Used Index & Impact Preview
 ## Grouped Multi-Product Reporting Summary
 ## Real-time Bus Progress & User Activities
 ## Powered By HSx Tech - Ali Muzafar
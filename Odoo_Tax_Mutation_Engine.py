@@ -0,0 +1,204 @@
+# Odoo Server Action: Batch Tax Mutation Engine (Replace / Remove / Add Taxes)
+# Model: Journal Entry (account.move)
+# Action To Do: Execute Python Code
+#
+# Usage:
+# Configure TAX_MAP below, select Invoices in the list view (Accounting > Invoices)
+# and run this action from the Action menu. Covers tax migrations such as the
+# yearly fiscal-position changes, and replaces the single-purpose add / remove
+# tax scripts:
+#   {OLD_TAX_ID: NEW_TAX_ID}  -> replace a tax on every line that has it
+#   {OLD_TAX_ID: None}        -> remove a tax
+#   {'add': [TAX_ID, ...]}    -> add taxes to every invoice line
+#
+# How it works:
+# The taxes of every invoice line of a batch are read with ONE query on the
+# account_move_line_account_tax_rel relation. Lines needing the same change
+# (taxes removed, taxes added) are written together with one write per change,
+# so taxes and totals are recomputed per move and change, not per line. A failing
+# batch is rolled back and retried invoice by invoice.
+
+# ── Configuration ────────────────────────────────────────────────────────────
+TAX_MAP = {
+    # 315: 320,
+    # 12: None,
+    # 'add': [330],
+}
+# Remove every tax not listed in TAX_MAP (before 'add' is applied)
+REMOVE_UNMAPPED_TAXES = False
+BATCH_SIZE = 100
+# Posted invoices: 'skip' = leave them untouched, 'repost' = reset to draft, update and post again
+# (paid or partially paid invoices are always skipped: resetting them would undo the reconciliation)
+POSTED_MODE = 'skip'
+# ─────────────────────────────────────────────────────────────────────────────
+
+if POSTED_MODE not in ('skip', 'repost'):
+    raise UserError("POSTED_MODE must be 'skip' or 'repost'.")
+
+replace_map = dict((k, v) for k, v in TAX_MAP.items() if k != 'add')
+add_tax_ids = set(TAX_MAP.get('add') or [])
+
+if not replace_map and not add_tax_ids and not REMOVE_UNMAPPED_TAXES:
+    raise UserError("Please configure TAX_MAP in the script.")
+
+# Every tax referenced must exist
+referenced_ids = set(replace_map.keys()) | set(v for v in replace_map.values() if v) | add_tax_ids
+missing_ids = referenced_ids - set(env['account.tax'].with_context(active_test=False).browse(list(referenced_ids)).exists().ids)
+if missing_ids:
+    raise UserError(f"Tax(es) not found: {sorted(missing_ids)}")
+
+all_eligible_ids = records.ids
+
+if not all_eligible_ids:
+    raise UserError("Please select at least one Invoice to update.")
+
+def new_taxes_of(current):
+    """Tax set of a line after applying TAX_MAP."""
+    result = set()
+    for tax_id in current:
+        if tax_id in replace_map:
+            if replace_map[tax_id]:
+                result.add(replace_map[tax_id])
+        elif not REMOVE_UNMAPPED_TAXES:
+            result.add(tax_id)
+    return result | add_tax_ids
+
+total_count = len(all_eligible_ids)
+success_count = 0
+updated_lines_count = 0
+skipped_count = 0
+reposted_count = 0
+paid_skipped_count = 0
+failed_count = 0
+write_count = 0
+
+def update_moves(move_ids, move_changes, posted_ids):
+    """Apply the line changes of these moves, one write per change signature."""
+    changes = {}
+    for move_id in move_ids:
+        for signature, line_id in move_changes[move_id]:
+            changes.setdefault(signature, []).append(line_id)
+    moves_to_repost = env['account.move'].browse([m for m in move_ids if m in posted_ids])
+    if moves_to_repost:
+        moves_to_repost.button_draft()
+    for (removed, added), line_ids in changes.items():
+        env['account.move.line'].browse(line_ids).write({
+            'tax_ids': [(3, t) for t in removed] + [(4, t) for t in added]
+        })
+    if moves_to_repost:
+        moves_to_repost.action_post()
+    return sum(len(ids) for ids in changes.values()), len(changes), len(moves_to_repost)
+
+log(f"Starting tax mutation for {total_count} selected invoices...", level='info')
+
+for i in range(0, total_count, BATCH_SIZE):
+    batch_ids = all_eligible_ids[i:i + BATCH_SIZE]
+
+    # Move states of the whole batch in one read
+    editable_ids = []
+    posted_ids = set()
+    for move in env['account.move'].browse(batch_ids).read(['state', 'payment_state']):
+        if move['state'] == 'draft':
+            editable_ids.append(move['id'])
+        elif move['state'] == 'posted' and POSTED_MODE == 'repost':
+            if move['payment_state'] == 'not_paid':
+                editable_ids.append(move['id'])
+                posted_ids.add(move['id'])
+            else:
+                paid_skipped_count += 1
+        else:
+            skipped_count += 1
+
+    # Current taxes of every invoice line of the batch, in one query
+    env.cr.execute("""
+        SELECT l.id, l.move_id, array_remove(array_agg(r.account_tax_id), NULL)
+          FROM account_move_line l
+          LEFT JOIN account_move_line_account_tax_rel r ON r.account_move_line_id = l.id
+         WHERE l.move_id = ANY(%s) AND l.display_type = 'product'
+         GROUP BY l.id, l.move_id
+    """, (editable_ids,))
+
+    # Change signature of every line to update: (removed taxes, added taxes)
+    move_changes = {}
+    for line_id, move_id, tax_ids in env.cr.fetchall():
+        current = set(tax_ids)
+        target = new_taxes_of(current)
+        if target == current:
+            continue
+        signature = (tuple(sorted(current - target)), tuple(sorted(target - current)))
+        move_changes.setdefault(move_id, []).append((signature, line_id))
+    changed_move_ids = list(move_changes.keys())
+
+    if changed_move_ids:
+        # Avoid 'with' as it's often restricted (forbidden opcodes)
+        # Use manual savepoints via SQL to protect the transaction
+        try:
+            env.cr.execute("SAVEPOINT tax_mutation_batch")
+            line_count, writes, repost_count = update_moves(changed_move_ids, move_changes, posted_ids)
+            env.flush_all()
+            env.cr.execute("RELEASE SAVEPOINT tax_mutation_batch")
+            updated_lines_count += line_count
+            write_count += writes
+            success_count += len(changed_move_ids)
+            reposted_count += repost_count
+        except Exception as e:
+            env.cr.execute("ROLLBACK TO SAVEPOINT tax_mutation_batch")
+            env.invalidate_all()
+            log("Batch tax mutation failed, falling back to individual invoices: %s" % str(e), level='warning')
+
+            # Fallback: invoice by invoice so one bad invoice does not block the batch
+            for move_id in changed_move_ids:
+                try:
+                    env.cr.execute("SAVEPOINT tax_mutation_move")
+                    line_count, writes, repost_count = update_moves([move_id], move_changes, posted_ids)
+                    env.flush_all()
+                    env.cr.execute("RELEASE SAVEPOINT tax_mutation_move")
+                    updated_lines_count += line_count
+                    write_count += writes
+                    success_count += 1
+                    reposted_count += repost_count
+                except Exception as ex:
+                    env.cr.execute("ROLLBACK TO SAVEPOINT tax_mutation_move")
+                    env.invalidate_all()
+                    log("Error updating taxes of Invoice %s: %s" % (env['account.move'].browse(move_id).name, str(ex)), level='error')
+                    failed_count += 1
+
+    # Commit to free up database locks
+    env.cr.commit()
+
+    # Notification for each batch
+    progress = min(i + BATCH_SIZE, total_count)
+    env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
+        'title': 'Batch Processing',
+        'message': f'Tax Mutation Progress: {progress}/{total_count} invoices...',
+        'type': 'info',
+        'sticky': False
+    })
+
+# Final summary notification
+message = f"✅ {success_count} invoices updated"
+message += f"\n💎 {updated_lines_count} lines modified in {write_count} grouped writes"
+if reposted_count:
+    message += f"\n🔁 {reposted_count} posted invoices reset to draft and re-posted"
+if skipped_count:
+    message += f"\n⏭️ {skipped_count} invoices skipped (posted or cancelled)"
+if paid_skipped_count:
+    message += f"\n💰 {paid_skipped_count} paid or partially paid invoices skipped (not re-posted)"
+if failed_count:
+    message += f"\n❌ {failed_count} invoices failed"
+
+action = {
+    'type': 'ir.actions.client',
+    'tag': 'display_notification',
+    'params': {
+        'title': 'Tax Mutation Complete',
+        'message': f"Processed {total_count} selected invoices.\n{message}",
+        'type': 'success' if not failed_count else 'warning',
+        'sticky': True
+    }
+}
+
+## Optimized for Selected Records
+## Grouped Writes per Change Signature
+## Real-time Batch Notifications via Bus
+## Powered By HSx Tech - Ali Muzafar
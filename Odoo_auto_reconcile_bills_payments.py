@@ -4,195 +4,605 @@
 
 # Usage:
 # Select Vendor Bills in the list view (Account > Vendors > Bills) and run this action.
-# The script will look for outstanding payments (credits) for the same partner.
+# The script will look for outstanding payments (debits) for the same partner.
 # It prioritizes matches in this order:
 # 1. Exact Amount Match AND Memo/Ref Match (Highest Priority)
 # 2. Exact Amount Match (Secondary Priority)
+#    "Exact" can be widened with an absolute/percentage tolerance (bank fees, rounding).
+# 3. Several Payments adding up to the Bill amount (Many-to-One, optional)
+#
+# Matching Engine:
+# All open payable debit lines for the selected partners/accounts are loaded in
+# ONE query and indexed in memory by (partner_id, account_id, currency, residual
+# in cents). Each bill then resolves its candidates with a single dictionary
+# lookup (or a binary search over the partner's sorted residuals when a
+# tolerance is set), so the cost stays flat as the selection grows.
+# Amounts are compared in the bill currency (amount_residual_currency on the
+# payment side), so foreign-currency bills match on their own currency.
+#
+# Scheduled Mode (ir.cron):
+# Create a Scheduled Action on account.move with this code. Without a selection
+# the script only examines payable lines created or changed since the last stored
+# watermark (write_date, id). Still-open bills/payments are kept in a small state
+# table between runs, so each run only re-matches the partners with new activity.
+# write_date is the writing transaction's start time, so a line committed late
+# can carry a write_date just behind the watermark: every run also re-scans the
+# last WATERMARK_OVERLAP_MINUTES before it (idempotent upserts).
 
-def get_outstanding_credits(partner_id, account_id):
+# ── Configuration ────────────────────────────────────────────────────────────
+# Many-to-One matching: when no single payment equals the bill residual, look
+# for 2..MAX_COMBINATION_SIZE open payments of the same partner that add up to it.
+ENABLE_MULTI_PAYMENT_MATCH = True
+MAX_COMBINATION_SIZE = 4
+# Upper bound on explored search nodes per bill (keeps large partners fast)
+MAX_SEARCH_NODES = 20000
+# Number of exact combinations collected per bill before ranking them
+MAX_COMBINATIONS_RANKED = 25
+# Matched pairs are reconciled in batches: one grouped reconcile call, one
+# commit and one progress notification per batch. Per-pair fallback only runs
+# when a whole batch fails. (Grouped reconcile uses _reconcile_plan, Odoo 17+.)
+BATCH_SIZE = 200
+# Scheduled Mode: max changed payable lines examined per run (the rest waits
+# for the next run) and where the watermark is stored (System Parameters).
+MAX_CHANGES_PER_RUN = 5000
+WATERMARK_PARAM = 'hsx_auto_reconcile.watermark'
+# Re-scan window behind the watermark; should exceed your longest accounting transaction
+WATERMARK_OVERLAP_MINUTES = 15
+# Amount tolerance (in the bill currency). The allowed difference is the larger
+# of TOLERANCE_AMOUNT and TOLERANCE_PERCENT % of the bill residual. 0 = exact.
+# Bills paid within tolerance are reconciled; the few cents left over stay open.
+TOLERANCE_AMOUNT = 0.0
+TOLERANCE_PERCENT = 0.0
+# ─────────────────────────────────────────────────────────────────────────────
+
+def amount_key(amount):
     """
-    Fetch outstanding credit lines for the partner and account.
-    Returns a recordset of account.move.line.
+    Normalize an amount to integer cents so it can be used as a hash key.
+    Equivalent to float_compare(..., precision_digits=2) == 0 for two amounts.
     """
-    domain = [
-        ('parent_state', '=', 'posted'),
-        ('account_id', '=', account_id),
-        ('partner_id', '=', partner_id),
-        ('reconciled', '=', False),
-        ('balance', '<', 0),  # credit > debit (negative balance for payable)
-        ('amount_residual', '!=', 0),
-    ]
-    # Search for lines (credit side, usually payments or refunds)
-    lines = env['account.move.line'].search(domain)
-    return lines
+    return int(round(abs(amount) * 100))
+
+def tolerance_cents(target):
+    """Allowed difference (in cents) around a bill residual of `target` cents."""
+    return max(amount_key(TOLERANCE_AMOUNT), int(target * TOLERANCE_PERCENT / 100.0))
+
+def bisect_left(values, x):
+    """Leftmost insertion point of `x` in the ascending list `values` (binary search)."""
+    lo, hi = 0, len(values)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if values[mid] < x:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+def bisect_right(values, x):
+    """Rightmost insertion point of `x` in the ascending list `values` (binary search)."""
+    lo, hi = 0, len(values)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if x < values[mid]:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+def tokenize(text):
+    """
+    Normalize a reference into a set of lowercase alphanumeric tokens.
+    "BILL/2023/001 - Acme" -> {'bill', '2023', '001', 'acme'}
+    """
+    tokens = set()
+    current = []
+    for ch in (text or '').lower():
+        if ch.isalnum():
+            current.append(ch)
+        elif current:
+            tokens.add(''.join(current))
+            current = []
+    if current:
+        tokens.add(''.join(current))
+    return tokens
+
+# Memo Token Index (built once per run over all candidate lines):
+#   line_tokens[line_id] -> tokens of the line's ref, name and move name
+#   token_index[token]   -> ids of the lines containing that token
+line_tokens = {}
+token_index = {}
+# Per-bill caches: tokens of ref+name, and ids of the lines matching the memo
+bill_tokens_cache = {}
+bill_memo_cache = {}
+
+def index_line_tokens(line):
+    tokens = tokenize(line['ref']) | tokenize(line['name']) | tokenize(line['move_name'])
+    line_tokens[line['id']] = tokens
+    for token in tokens:
+        token_index.setdefault(token, set()).add(line['id'])
+
+def lines_containing(tokens):
+    """Ids of the indexed lines containing ALL of the given tokens."""
+    if not tokens:
+        return set()
+    postings = sorted([token_index.get(t, set()) for t in tokens], key=len)
+    result = set(postings[0])
+    for posting in postings[1:]:
+        if not result:
+            break
+        result &= posting
+    return result
+
+def bill_tokens(bill):
+    if bill.id not in bill_tokens_cache:
+        bill_tokens_cache[bill.id] = tokenize(bill.ref) | tokenize(bill.name)
+    return bill_tokens_cache[bill.id]
 
 def is_memo_match(bill, credit_line):
     """
     Check if the Payment Ref/Memo matches the Bill Ref/Name.
-    Case insensitive containment check.
+    A match means every token of the Bill Ref (or of the Bill Name, e.g.
+    BILL/2023/001) appears in the line's ref, name or move name.
+    Resolved once per bill through the token index, then a set lookup per line.
+    """
+    if bill.id not in bill_memo_cache:
+        bill_memo_cache[bill.id] = lines_containing(tokenize(bill.ref)) | lines_containing(tokenize(bill.name))
+    return credit_line['id'] in bill_memo_cache[bill.id]
+
+def memo_similarity(bill, credit_line):
+    """
+    Jaccard similarity (0.0 - 1.0) between the Bill Ref/Name tokens and the
+    line tokens. Used to break ties between same-amount candidates.
+    """
+    b_tokens = bill_tokens(bill)
+    l_tokens = line_tokens.get(credit_line['id'], set())
+    union = len(b_tokens | l_tokens)
+    return len(b_tokens & l_tokens) / union if union else 0.0
+
+def candidate_rank(bill, credit_line):
+    """Sort key: memo match first, then closest amount, then highest similarity, then oldest line."""
+    return (
+        0 if is_memo_match(bill, credit_line) else 1,
+        abs(credit_line['cents'] - amount_key(bill.amount_residual)),
+        -memo_similarity(bill, credit_line),
+        credit_line['id'],
+    )
+
+def compute_assignment(bill_ids, bill_edges, memo_edges):
     """
-    bill_ref = (bill.ref or '').strip().lower()
-    bill_name = (bill.name or '').strip().lower()
-    
-    # Credit line often has 'name' or related payment 'ref'
-    # We check the move line name (e.g. "INV/2023/001") or the move's ref
-    credit_ref = (credit_line.ref or '').strip().lower()
-    credit_name = (credit_line.name or '').strip().lower()
-    credit_move_name = (credit_line.move_id.name or '').strip().lower()
-    
-    # Gather all potential identifiers from the credit line side
-    credit_identifiers = [credit_ref, credit_name, credit_move_name]
-    
-    # Search for Bill Ref in Credit Identifiers
-    if bill_ref:
-        for ident in credit_identifiers:
-            if bill_ref in ident:
-                return True
-                
-    # Search for Bill Name (__name__ is the sequence like INV/2023/001) in Credit Identifiers
-    if bill_name:
-         for ident in credit_identifiers:
-            if bill_name in ident:
-                return True
-                
-    return False
-
-# Iterate over selected records (Bills)
+    Conflict-free bipartite assignment of bills to payment lines for the whole
+    selection. Each payment line is used at most once.
+
+    Phase 1 builds a maximum matching using memo edges only, Phase 2 extends
+    it with amount-only edges through augmenting paths (already matched bills
+    stay matched). Within one (partner, account, amount) group every bill can
+    take every line, so the result has the maximum number of reconciliations
+    and, among those, the maximum number of memo matches. With a tolerance the
+    groups overlap; the result is still maximum, memo edges are preferred.
+
+    `bill_edges` / `memo_edges`: {bill_id: [line_id, ...]} in preference order.
+    Returns {bill_id: line_id}.
+    """
+    bill_match = {}
+    line_match = {}
+
+    for edges in (memo_edges, bill_edges):
+        # Lines reached by a failed search can never lead to a free line again
+        # during this phase (their whole alternating tree is saturated).
+        dead_lines = set()
+        for root in bill_ids:
+            if root in bill_match or not edges.get(root):
+                continue
+            # BFS over alternating paths: bill -> line -> matched bill -> ...
+            came_from = {}
+            queue = [root]
+            free_line = None
+            pos = 0
+            while pos < len(queue) and free_line is None:
+                b_id = queue[pos]
+                pos += 1
+                for l_id in edges.get(b_id, []):
+                    if l_id in came_from or l_id in dead_lines:
+                        continue
+                    came_from[l_id] = b_id
+                    if l_id not in line_match:
+                        free_line = l_id
+                        break
+                    queue.append(line_match[l_id])
+
+            if free_line is None:
+                dead_lines.update(came_from)
+                continue
+
+            # Flip the augmenting path back to the root
+            l_id = free_line
+            while True:
+                b_id = came_from[l_id]
+                previous = bill_match.get(b_id)
+                bill_match[b_id] = l_id
+                line_match[l_id] = b_id
+                if b_id == root:
+                    break
+                l_id = previous
+
+    return bill_match
+
+def find_payment_combinations(pool, target, tolerance=0):
+    """
+    Bounded subset-sum search over open debit lines (amounts in integer cents).
+    `pool` is a list of (cents, line) sorted by cents DESC.
+    Returns up to MAX_COMBINATIONS_RANKED lists of lines summing to `target`
+    (+/- `tolerance` cents), each with 2..MAX_COMBINATION_SIZE lines.
+    """
+    # Drop anything larger than the target up front
+    pool = [p for p in pool if p[0] <= target + tolerance]
+    count = len(pool)
+    if count < 2:
+        return []
+
+    # prefix[i] = sum of the i largest amounts, used to bound what is still reachable
+    prefix = [0]
+    for cents, line in pool:
+        prefix.append(prefix[-1] + cents)
+
+    solutions = []
+    budget = {'nodes': 0}
+
+    def search(start, remaining, chosen):
+        slots = MAX_COMBINATION_SIZE - len(chosen)
+        for i in range(start, count):
+            if len(solutions) >= MAX_COMBINATIONS_RANKED or budget['nodes'] >= MAX_SEARCH_NODES:
+                return
+            budget['nodes'] += 1
+            cents = pool[i][0]
+            # Pruning 1: too large for what is left -> try a smaller amount
+            if cents > remaining + tolerance:
+                continue
+            # Pruning 2: even the largest remaining amounts cannot reach the target.
+            # The pool is sorted DESC, so later positions can only do worse.
+            if prefix[min(i + slots, count)] - prefix[i] < remaining - tolerance:
+                return
+            if abs(remaining - cents) <= tolerance and chosen:
+                solutions.append(chosen + [pool[i][1]])
+            # Keep extending while the sum is still below target + tolerance:
+            # a within-tolerance partial sum may still grow into an exact one
+            if slots > 1 and remaining - cents > -tolerance:
+                search(i + 1, remaining - cents, chosen + [pool[i][1]])
+
+    search(0, target, [])
+    return solutions
+
+def sync_open_items():
+    """
+    Scheduled Mode: fold payable lines changed since the watermark into the
+    persisted open-items state and return the open (partner_id, account_id)
+    pairs they touched, plus the state's open bill and payment line ids there.
+    """
+    env.cr.execute("""
+        CREATE TABLE IF NOT EXISTS hsx_reconcile_open_item (
+            line_id integer PRIMARY KEY,
+            kind varchar NOT NULL,
+            move_id integer NOT NULL,
+            partner_id integer NOT NULL,
+            account_id integer NOT NULL
+        )
+    """)
+    # The state only tracks which lines are open; amounts are always re-read live
+    env.cr.execute("ALTER TABLE hsx_reconcile_open_item DROP COLUMN IF EXISTS amount_cents")
+    env.cr.execute("CREATE INDEX IF NOT EXISTS hsx_reconcile_open_item_partner_idx ON hsx_reconcile_open_item (partner_id, account_id)")
+    # Lets the change scan below read only new activity instead of the whole table
+    env.cr.execute("CREATE INDEX IF NOT EXISTS hsx_aml_write_date_id_idx ON account_move_line (write_date, id)")
+
+    ICP = env['ir.config_parameter'].sudo()
+    watermark = ICP.get_param(WATERMARK_PARAM)
+
+    # Same matching domain as the manual mode, expressed in SQL:
+    # bills = CREDIT payable lines of in_invoice, payments = DEBIT payable lines of anything else.
+    base_query = """
+        SELECT aml.id, aml.write_date::text, aml.move_id, aml.partner_id, aml.account_id,
+               aml.amount_residual, aml.balance, aml.reconciled, aml.parent_state, move.move_type
+          FROM account_move_line aml
+          JOIN account_account acc ON acc.id = aml.account_id
+          JOIN account_move move ON move.id = aml.move_id
+         WHERE acc.account_type = 'liability_payable'
+    """
+    if watermark:
+        last_date, last_id = watermark.split('|')
+        env.cr.execute(base_query + """
+               AND (aml.write_date, aml.id) > (%s::timestamp, %s)
+             ORDER BY aml.write_date, aml.id LIMIT %s
+        """, (last_date, int(last_id), MAX_CHANGES_PER_RUN))
+        changed = env.cr.fetchall()
+
+        # Overlap: lines committed late with a write_date just behind the watermark
+        env.cr.execute(base_query + """
+               AND aml.write_date > %s::timestamp - make_interval(mins => %s)
+               AND (aml.write_date, aml.id) <= (%s::timestamp, %s)
+             ORDER BY aml.write_date, aml.id LIMIT %s
+        """, (last_date, WATERMARK_OVERLAP_MINUTES, last_date, int(last_id), MAX_CHANGES_PER_RUN))
+        rescanned = env.cr.fetchall()
+    else:
+        # First run: bootstrap the state from the currently open items only
+        env.cr.execute(base_query + """
+               AND aml.reconciled IS NOT TRUE AND aml.parent_state = 'posted'
+             ORDER BY aml.write_date, aml.id LIMIT %s
+        """, (MAX_CHANGES_PER_RUN,))
+        changed = env.cr.fetchall()
+        rescanned = []
+
+    touched = set()
+    closed_ids = []
+    for line_id, write_date, move_id, partner_id, account_id, residual, balance, reconciled, parent_state, move_type in rescanned + changed:
+        if move_type == 'in_invoice':
+            kind = 'bill' if balance < 0 else None
+        else:
+            kind = 'payment' if balance > 0 else None
+        is_open = kind and partner_id and parent_state == 'posted' and not reconciled and residual
+        if not is_open:
+            closed_ids.append(line_id)
+            continue
+        env.cr.execute("""
+            INSERT INTO hsx_reconcile_open_item (line_id, kind, move_id, partner_id, account_id)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (line_id) DO UPDATE SET kind = EXCLUDED.kind,
+                                                partner_id = EXCLUDED.partner_id,
+                                                account_id = EXCLUDED.account_id
+        """, (line_id, kind, move_id, partner_id, account_id))
+        touched.add((partner_id, account_id))
+
+    if closed_ids:
+        env.cr.execute("DELETE FROM hsx_reconcile_open_item WHERE line_id = ANY(%s)", (closed_ids,))
+
+    if changed:
+        last = changed[-1]
+        ICP.set_param(WATERMARK_PARAM, f"{last[1]}|{last[0]}")
+
+    bill_move_ids = []
+    payment_line_ids = []
+    if touched:
+        pairs = list(touched)
+        env.cr.execute("""
+            SELECT kind, move_id, line_id FROM hsx_reconcile_open_item
+             WHERE (partner_id, account_id) IN %s
+        """, (tuple(pairs),))
+        for kind, move_id, line_id in env.cr.fetchall():
+            if kind == 'bill':
+                bill_move_ids.append(move_id)
+            else:
+                payment_line_ids.append(line_id)
+
+    log(f"Auto reconcile watermark run: {len(changed)} changed lines ({len(rescanned)} re-scanned), {len(touched)} partners touched.", level='info')
+    return bill_move_ids, payment_line_ids
+
+# Selection Mode: the bills selected in the list view.
+# Scheduled Mode: the open bills of partners with activity since the watermark.
+scheduled_mode = not records
+state_payment_line_ids = None
+if scheduled_mode:
+    state_bill_ids, state_payment_line_ids = sync_open_items()
+    candidate_bills = env['account.move'].browse(list(set(state_bill_ids)))
+else:
+    candidate_bills = records
+
 # Ensure we only process open Bills (posted, not paid)
-bills_to_process = records.filtered(lambda r: r.move_type == 'in_invoice' and r.state == 'posted' and r.payment_state != 'paid')
+bills_to_process = candidate_bills.filtered(lambda r: r.move_type == 'in_invoice' and r.state == 'posted' and r.payment_state != 'paid')
 
 reconciled_count = 0
 
-for bill in bills_to_process:
-    # 1. Get Outstanding Credits (Payments)
-    # Use the bill's payable account (usually on the partner or set on the line)
-    # Getting the payable line from the bill to know the account
-    payable_line = bill.line_ids.filtered(lambda l: l.account_id.account_type == 'liability_payable' and l.balance < 0)
-    
-    if not payable_line:
-        # Fallback or weird state, maybe not a standard bill
-        continue
-        
-    # There could be multiple payable lines, but usually one main one. 
-    # Validating against the partner and account of the bill.
-    account_id = payable_line[0].account_id.id
-    partner_id = bill.partner_id.id
-    
-    outstanding_credits = get_outstanding_credits(partner_id, account_id)
-    
-    if not outstanding_credits:
-        continue
+# ── 1. Resolve the payable account of every bill in ONE query ───────────────
+# Vendor Bill (in_invoice) -> CREDIT on the Payable account (balance < 0).
+bill_payable_rows = env['account.move.line'].search_read([
+    ('move_id', 'in', bills_to_process.ids),
+    ('account_id.account_type', '=', 'liability_payable'),
+    ('balance', '<', 0),
+], ['move_id', 'account_id'], order='id asc')
 
-    # 2. Find Best Match
-    best_match = None
-    
-    # Strategy 1: Exact Amount AND Memo Match
-    for credit in outstanding_credits:
-        # amount_residual is positive for the remaining amount to reconcile
-        # credit line balance is negative. amount_residual_currency or amount_residual depends on currency.
-        # We compare absolute values of residual.
-        
-        # Note: amount_residual on credit line is usually negative if it's a credit (liability)? 
-        # Actually in Odoo 14+ amount_residual is the amount left to pay/receive. 
-        # For a Payment (credit side on payable), amount_residual is negative.
-        # For a Bill (credit side on payable for the invoice amount), wait...
-        # Bill: Credit Payables (Balance < 0). 
-        # Payment: Debit Payables (Balance > 0) to offset the Bill.
-        
-        # WAIT. A Vendor Bill (in_invoice) creates a CREDIT on Payable Account.
-        # A Vendor Payment (outbound) creates a DEBIT on Payable Account.
-        
-        # So we need to look for outstanding DEBITS (Payments) to match the Bill (Credit).
-        # My helper function `get_outstanding_credits` searched for `balance < 0`. 
-        # That would be credits (like Refunds).
-        # Vendor Payments are DEBITS on the payable account.
-        
-        # Correction: 
-        # Vendor Bill -> CREDIT on Payable.
-        # Payment -> DEBIT on Payable.
-        # So we look for lines with `balance > 0` (Debits) on the payable account.
-        
-        # However, `outstanding_credits` implies we are looking for available money.
-        # Let's fix the search domain logic.
-    
-        pass # Placeholder for thought correction
-
-    # REDO Search Domain Logic inline correctly:
-    # Vendor Bill (in_invoice) has a Payable Line with Negative Balance (Credit).
-    # We want to match it with a Payment (Debit) on the Payable Account.
-    # The Payment line will have Positive Balance (Debit) and Reconciled=False.
-    
-    # What if it's a Vendor Refund? (in_refund). It has a Debit on Payable.
-    # We match it with a Bill? No, we reconcile Bill with Refund.
-    # User said "Reconcile payments with bills listed in outstanding credits".
-    # In Odoo UI these are called "Outstanding Debits" if it's a Vendor Bill we are looking at? 
-    # Or "Outstanding Credits" if we are looking at a Customer Invoice?
-    
-    # Actually, Odoo's widget usually shows "Outstanding Debits" for Vendor Bills.
-    # Because you "have a debt" (Bill), and you apply a "Debit" (Payment) to reduce it.
-    
-    # Let's assume standard Vendor Bill Reconcile flow.
-    # We look for lines with `debit > 0` (or balance > 0) on the same account.
-    
-    potential_matches = []
-    
-    # Re-fetching with correct domain
-    domain = [
+bill_account_map = {}
+bill_payable_line_ids = {}
+for row in bill_payable_rows:
+    # There could be multiple payable lines, but usually one main one.
+    bill_id = row['move_id'][0]
+    bill_account_map.setdefault(bill_id, row['account_id'][0])
+    if row['account_id'][0] == bill_account_map[bill_id]:
+        bill_payable_line_ids.setdefault(bill_id, []).append(row['id'])
+
+partner_ids = list(set(bills_to_process.mapped('partner_id').ids))
+account_ids = list(set(bill_account_map.values()))
+
+# ── 2. Load every open payable DEBIT line (Payments) in ONE query ───────────
+# Vendor Payment (outbound) -> DEBIT on the Payable account (balance > 0).
+# In Odoo's UI these are shown as "Outstanding Debits" on the Vendor Bill.
+debit_index = {}
+partner_pools = {}
+if partner_ids and account_ids:
+    debit_domain = [
         ('parent_state', '=', 'posted'),
-        ('account_id', '=', account_id),
-        ('partner_id', '=', partner_id),
+        ('account_id', 'in', account_ids),
+        ('partner_id', 'in', partner_ids),
         ('reconciled', '=', False),
         ('balance', '>', 0), # Debits (Payments)
-        ('move_id.move_type', '!=', 'in_invoice'), # Don't match other bills (though they are credits usually)
+        ('move_id.move_type', '!=', 'in_invoice'), # Don't match other bills
     ]
-    available_lines = env['account.move.line'].search(domain)
-    
-    # Filter for candidates
+    if state_payment_line_ids is not None:
+        # Scheduled Mode: the persisted state already knows the open payments
+        debit_domain.append(('id', 'in', state_payment_line_ids))
+    open_debit_lines = env['account.move.line'].search_read(
+        debit_domain, ['partner_id', 'account_id', 'currency_id', 'amount_residual', 'amount_residual_currency',
+                       'ref', 'name', 'move_name'], order='id asc')
+
+    # Hash index: (partner_id, account_id, currency_id, residual_cents) -> [lines ordered by id]
+    # Residuals are taken in the line currency (amount_residual_currency), which
+    # equals amount_residual for lines in the company currency.
+    for line in open_debit_lines:
+        if not line['partner_id'] or not line['amount_residual']:
+            continue
+        currency_id = line['currency_id'][0] if line['currency_id'] else False
+        residual = line['amount_residual_currency'] if currency_id else line['amount_residual']
+        partner_group = (line['partner_id'][0], line['account_id'][0], currency_id)
+        cents = amount_key(residual)
+        line['cents'] = cents
+        debit_index.setdefault(partner_group + (cents,), []).append(line)
+        # Per partner/account/currency pool for tolerance and Many-to-One matching
+        partner_pools.setdefault(partner_group, []).append((cents, line))
+        index_line_tokens(line)
+
+    # Largest amounts first so the subset-sum search can prune early
+    for pool in partner_pools.values():
+        pool.sort(key=lambda p: (-p[0], p[1]['id']))
+
+# Sorted residual arrays per partner/account/currency (ascending cents), so a
+# tolerance window [target - tol, target + tol] resolves with two binary searches.
+sorted_residuals = {}
+if TOLERANCE_AMOUNT or TOLERANCE_PERCENT:
+    for partner_group, pool in partner_pools.items():
+        ascending = pool[::-1]
+        sorted_residuals[partner_group] = ([p[0] for p in ascending], [p[1] for p in ascending])
+
+def find_single_candidates(partner_group, target):
+    """Open payment lines of the group whose residual matches `target` cents (within tolerance)."""
+    if partner_group not in sorted_residuals:
+        return debit_index.get(partner_group + (target,), [])
+    amounts, lines = sorted_residuals[partner_group]
+    tol = tolerance_cents(target)
+    return lines[bisect_left(amounts, target - tol):bisect_right(amounts, target + tol)]
+
+# ── 3. Resolve candidates per bill in O(1) ──────────────────────────────────
+bill_ids = []
+bills_by_id = {}
+bill_edges = {}
+memo_edges = {}
+
+for bill in bills_to_process:
+    account_id = bill_account_map.get(bill.id)
+    if not account_id:
+        # Fallback or weird state, maybe not a standard bill
+        continue
+
+    # bill.amount_residual is expressed in the bill currency
+    partner_group = (bill.partner_id.id, account_id, bill.currency_id.id)
+    bill_ids.append(bill.id)
+    bills_by_id[bill.id] = (bill, partner_group)
+
     # We need to match the Bill's residual amount
-    bill_residual = abs(bill.amount_residual)
-    
-    candidates = []
-    for line in available_lines:
-        line_residual = abs(line.amount_residual)
-        
-        if float_compare(line_residual, bill_residual, precision_digits=2) == 0:
-            candidates.append(line)
-            
+    candidates = find_single_candidates(partner_group, amount_key(bill.amount_residual))
     if not candidates:
         continue
-        
+
     # We have candidates with MATCHING AMOUNT.
-    # Now check for Memo/Ref Match (Priority 1)
-    
-    match_found = None
-    
-    # Priority 1: Check Memo
-    for cand in candidates:
-        if is_memo_match(bill, cand):
-            match_found = cand
-            break
-            
-    # Priority 2: If no memo match, pick the first amount match
-    if not match_found and candidates:
-        match_found = candidates[0]
-        
-    if match_found:
-        # Perform Reconciliation
-        # Only assign the single matching line
-        try:
-            bill.js_assign_outstanding_line(match_found.id)
-            reconciled_count += 1
-        except Exception as e:
-            # Prevent blocking other bills if one fails
-            log("Error reconciling Bill %s: %s" % (bill.name, str(e)))
-            
+    # Priority 1: Memo match, Priority 2: amount only.
+    # Same priority ties go to the closest amount, the highest memo similarity,
+    # then the oldest line.
+    ranked = sorted(candidates, key=lambda cand: candidate_rank(bill, cand))
+    bill_edges[bill.id] = [cand['id'] for cand in ranked]
+    memo_edges[bill.id] = [cand['id'] for cand in ranked if is_memo_match(bill, cand)]
+
+# ── 4. Global assignment over the whole selection ───────────────────────────
+# Two bills with the same partner and amount never target the same payment.
+assignment = compute_assignment(bill_ids, bill_edges, memo_edges)
+
+# Lines already assigned during this run (never offered to a combination again)
+used_line_ids = set(assignment.values())
+multi_bills = []
+
+# Matched pairs to reconcile: [(bill, [payment_line_ids])]
+matched_pairs = []
+
+for bill_id in bill_ids:
+    bill, partner_group = bills_by_id[bill_id]
+    line_id = assignment.get(bill_id)
+    if not line_id:
+        # No single payment left for this bill: retry later with several payments
+        multi_bills.append((bill, partner_group))
+        continue
+    matched_pairs.append((bill, [line_id]))
+
+# ── 5. Many-to-One: several payments adding up to one bill ──────────────────
+if ENABLE_MULTI_PAYMENT_MATCH:
+    for bill, partner_group in multi_bills:
+        pool = [p for p in partner_pools.get(partner_group, []) if p[1]['id'] not in used_line_ids]
+        target = amount_key(bill.amount_residual)
+        combinations = find_payment_combinations(pool, target, tolerance_cents(target))
+        if not combinations:
+            continue
+
+        # Rank competing combinations: most memo matches, then closest total,
+        # then fewest payments, then best memo similarity, then oldest lines (deterministic).
+        combinations.sort(key=lambda combo: (
+            -len([l for l in combo if is_memo_match(bill, l)]),
+            abs(sum(l['cents'] for l in combo) - target),
+            len(combo),
+            -sum(memo_similarity(bill, l) for l in combo),
+            sorted(l['id'] for l in combo),
+        ))
+        best = [l['id'] for l in combinations[0]]
+        used_line_ids.update(best)
+        matched_pairs.append((bill, best))
+
+# ── 6. Batched reconciliation with commit & progress ────────────────────────
+AML = env['account.move.line']
+multi_reconciled_count = 0
+failed_count = 0
+total_pairs = len(matched_pairs)
+
+def reconcile_pair_lines(bill, payment_line_ids):
+    return AML.browse(bill_payable_line_ids[bill.id] + payment_line_ids)
+
+for i in range(0, total_pairs, BATCH_SIZE):
+    batch = matched_pairs[i:i + BATCH_SIZE]
+
+    # Avoid 'with' as it's often restricted (forbidden opcodes)
+    # Use manual savepoints via SQL to protect the transaction
+    try:
+        env.cr.execute('SAVEPOINT reconcile_batch_sp')
+        # One grouped call: each pair is reconciled as its own group
+        AML._reconcile_plan([reconcile_pair_lines(bill, line_ids) for bill, line_ids in batch])
+        # Run the pending computes (residuals, matching numbers) inside the savepoint
+        env.flush_all()
+        env.cr.execute('RELEASE SAVEPOINT reconcile_batch_sp')
+        succeeded = batch
+    except Exception as e:
+        env.cr.execute('ROLLBACK TO SAVEPOINT reconcile_batch_sp')
+        env.invalidate_all()
+        log("Batch reconcile failed, falling back to individual pairs: %s" % str(e), level='warning')
+
+        # Fallback: reconcile pair by pair so one bad pair does not block the batch
+        succeeded = []
+        for bill, line_ids in batch:
+            try:
+                env.cr.execute('SAVEPOINT reconcile_pair_sp')
+                reconcile_pair_lines(bill, line_ids).reconcile()
+                env.flush_all()
+                env.cr.execute('RELEASE SAVEPOINT reconcile_pair_sp')
+                succeeded.append((bill, line_ids))
+            except Exception as ex:
+                env.cr.execute('ROLLBACK TO SAVEPOINT reconcile_pair_sp')
+                env.invalidate_all()
+                log("Error reconciling Bill %s: %s" % (bill.name, str(ex)), level='error')
+                failed_count += 1
+
+    reconciled_count += len(succeeded)
+    multi_reconciled_count += len([p for p in succeeded if len(p[1]) > 1])
+
+    # Commit to save progress and keep each transaction short
+    env.cr.commit()
+
+    # Real-time progress bus notification
+    progress = min(i + BATCH_SIZE, total_pairs)
+    env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
+        'title': 'Reconciliation Progress',
+        'message': f'Processed {progress}/{total_pairs} matched bills ({reconciled_count} reconciled)...',
+        'type': 'info',
+        'sticky': False
+    })
+
 # Optional: Raise a notification summary
 action = {
     'type': 'ir.actions.client',
     'tag': 'display_notification',
     'params': {
         'title': 'Reconciliation Complete',
-        'message': f'Reconciled {reconciled_count} bills successfully.',
+        'message': f'Reconciled {reconciled_count} bills successfully ({multi_reconciled_count} with multiple payments).'
+                   + (f' {failed_count} failed, see logs.' if failed_count else ''),
+        'type': 'success' if failed_count == 0 else 'warning',
         'sticky': False,
     }
 }
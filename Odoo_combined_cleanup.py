@@ -1,45 +1,236 @@
-# Combined BOM Cleanup (Archived + Duplicates)
+# Combined BOM Cleanup Engine (Archived + Duplicates + Zero Qty)
 # Part of Odoo BOM Cleanup Tools - Powered by Hsx TECH
+# Model: Bill of Materials (mrp.bom) or BOM Line (mrp.bom.line)
+# Action To Do: Execute Python Code
+#
+# Usage:
+# Select BOMs (or BOM lines) in the list view and run this action.
+# Every BOM line is read ONCE per batch and checked against all enabled rules in
+# a single pass. Lines hit by any rule are removed with ONE unlink per batch.
+# The result is reported per rule.
+#
+# Variant-aware duplicates:
+# On template BoMs whose lines use "Apply on Variants", a component is only a
+# duplicate when some variant gets it twice (e.g. the same screw for "Red" and for
+# "Blue" is kept). Each BoM is expanded per distinct attribute combination, once,
+# and the combination is shared by all variants having it.
+#
+# Adding a rule:
+# Write a function rule_xxx(line, kept) returning True when the line must be
+# removed, and register it in RULES. `line` is the prefetched line row (dict),
+# `kept` describes what the same BOM already kept
+# ({'product_ids': set(), 'group_products': {variant_group: set()}}).
 
-def combined_bom_cleanup(self):
-    """
-    Performs both archived product removal and duplicate cleanup
+# ── Configuration ────────────────────────────────────────────────────────────
+BATCH_SIZE = 200
+# Rules to apply, in evaluation order (a line is counted under the first rule it hits)
+ENABLED_RULES = ['archived', 'zero_qty', 'duplicate']
+# Per-variant duplicate check on template BoMs with "Apply on Variants" lines
+CHECK_VARIANT_DUPLICATES = True
+# ─────────────────────────────────────────────────────────────────────────────
+
+def rule_archived(line, kept):
+    """Component product is archived."""
+    return not line['product_active']
+
+def rule_zero_qty(line, kept):
+    """Quantity rounds to zero in the line's unit of measure."""
+    return abs(line['product_qty']) < line['uom_rounding'] / 2.0
+
+def rule_duplicate(line, kept):
+    """Same component already kept earlier in this BOM (first line by sequence/id wins)."""
+    if line['variant_groups'] is None:
+        return line['product_id'] in kept['product_ids']
+    # Variant-specific BoM: redundant only if every variant getting this line already has the component
+    return bool(line['variant_groups']) and all(
+        line['product_id'] in kept['group_products'].get(g, ()) for g in line['variant_groups'])
+
+# Rule registry: code -> (label, function)
+RULES = {
+    'archived': ('Archived Products', rule_archived),
+    'zero_qty': ('Zero Quantity', rule_zero_qty),
+    'duplicate': ('Duplicates', rule_duplicate),
+}
+
+def expand_variant_boms(bom_ids):
+    """Per-variant view of template BoMs using "Apply on Variants" lines.
+
+    Returns {bom_id: [(line_ids, variant_count)]}, one entry per distinct set of
+    lines a variant actually gets. Variants are grouped in SQL by their values on
+    the attributes the BoM's lines filter on, so each combination is expanded once
+    and shared by all its variants (nothing is kept per variant).
     """
-    boms = self if self else self.env['mrp.bom'].browse(self.env.context.get('active_ids'))
-    stats = {'archived': 0, 'duplicates': 0}
-
-    for bom in boms:
-        # Remove archived
-        archived = bom.bom_line_ids.filtered(lambda l: not l.product_id.active)
-        if archived:
-            stats['archived'] += len(archived)
-            bom.write({'bom_line_ids': [(3, a.id) for a in archived]})
-        
-        # Remove duplicates
-        seen = set()
-        duplicates = []
-        for line in bom.bom_line_ids:
-            if line.product_id.id in seen:
-                duplicates.append(line.id)
-            else:
-                seen.add(line.product_id.id)
-        
-        if duplicates:
-            stats['duplicates'] += len(duplicates)
-            bom.write({'bom_line_ids': [(3, d) for d in duplicates]})
-
-    return {
-        'type': 'ir.actions.client',
-        'tag': 'display_notification',
-        'params': {
-            'title': 'BOM Cleanup Complete',
-            'message': f"""Cleaned {len(boms)} BOM(s):
-            - Archived: {stats['archived']} removed
-            - Duplicates: {stats['duplicates']} removed""",
-            'type': 'success',
-            'sticky': True,
+    env.cr.execute("""
+        SELECT l.bom_id, l.id, v.attribute_id, v.id
+          FROM mrp_bom_line l
+          JOIN mrp_bom b ON b.id = l.bom_id
+          JOIN mrp_bom_line_product_template_attribute_value_rel r ON r.mrp_bom_line_id = l.id
+          JOIN product_template_attribute_value v ON v.id = r.product_template_attribute_value_id
+          JOIN product_attribute a ON a.id = v.attribute_id AND a.create_variant != 'no_variant'
+         WHERE l.bom_id = ANY(%s) AND b.product_id IS NULL
+    """, (list(bom_ids),))
+    line_filters = {}
+    expanded_ids = set()
+    for bom_id, line_id, attribute_id, ptav_id in env.cr.fetchall():
+        line_filters.setdefault(line_id, {}).setdefault(attribute_id, set()).add(ptav_id)
+        expanded_ids.add(bom_id)
+    if not expanded_ids:
+        return {}
+    expanded_ids = list(expanded_ids)
+
+    env.cr.execute("SELECT bom_id, id FROM mrp_bom_line WHERE bom_id = ANY(%s) ORDER BY bom_id, sequence, id", (expanded_ids,))
+    lines_by_bom = {}
+    for bom_id, line_id in env.cr.fetchall():
+        lines_by_bom.setdefault(bom_id, []).append(line_id)
+
+    # Distinct variant combinations per BoM, restricted to the attributes its lines use
+    env.cr.execute("""
+        WITH bom_attribute AS (
+            SELECT DISTINCT l.bom_id, v.attribute_id
+              FROM mrp_bom_line l
+              JOIN mrp_bom_line_product_template_attribute_value_rel r ON r.mrp_bom_line_id = l.id
+              JOIN product_template_attribute_value v ON v.id = r.product_template_attribute_value_id
+             WHERE l.bom_id = ANY(%s)
+        ), variant_combination AS (
+            SELECT b.id AS bom_id, pp.id AS variant_id,
+                   array_agg(v.id ORDER BY v.id) FILTER (WHERE v.id IS NOT NULL) AS combination
+              FROM mrp_bom b
+              JOIN product_product pp ON pp.product_tmpl_id = b.product_tmpl_id AND pp.active
+              LEFT JOIN product_variant_combination c ON c.product_product_id = pp.id
+              LEFT JOIN product_template_attribute_value v ON v.id = c.product_template_attribute_value_id
+                   AND EXISTS (SELECT 1 FROM bom_attribute ba WHERE ba.bom_id = b.id AND ba.attribute_id = v.attribute_id)
+             WHERE b.id = ANY(%s)
+             GROUP BY b.id, pp.id
+        )
+        SELECT bom_id, combination, count(*)
+          FROM variant_combination
+         GROUP BY bom_id, combination
+    """, (expanded_ids, expanded_ids))
+
+    variant_sets = {}
+    for bom_id, combination, variant_count in env.cr.fetchall():
+        values = set(combination or [])
+        # A line applies when the variant has one of its values for every filtered attribute
+        line_ids = tuple(l for l in lines_by_bom.get(bom_id, [])
+                         if all(values & ptav_ids for ptav_ids in line_filters.get(l, {}).values()))
+        # Combinations giving the same lines share one entry
+        sets = variant_sets.setdefault(bom_id, {})
+        sets[line_ids] = sets.get(line_ids, 0) + variant_count
+    return {bom_id: list(sets.items()) for bom_id, sets in variant_sets.items()}
+
+active_rules = [(code, RULES[code][0], RULES[code][1]) for code in ENABLED_RULES if code in RULES]
+if not active_rules:
+    raise UserError("Please enable at least one cleanup rule in ENABLED_RULES.")
+
+# Detect selection context (Model and IDs)
+active_model = env.context.get('active_model')
+active_ids = env.context.get('active_ids', [])
+
+if active_model == 'mrp.bom.line':
+    bom_ids = env['mrp.bom.line'].browse(active_ids).mapped('bom_id').ids
+else:
+    bom_ids = active_ids
+
+if not bom_ids:
+    raise UserError("Please select at least one BOM to clean.")
+
+total_boms = len(bom_ids)
+stats = {code: 0 for code, label, func in active_rules}
+modified_bom_ids = set()
+
+for i in range(0, total_boms, BATCH_SIZE):
+    batch_ids = bom_ids[i:i + BATCH_SIZE]
+
+    # Prefetch every line of the batch in ONE query, in bom_line_ids order
+    env.cr.execute("""
+        SELECT l.id, l.bom_id, l.product_id, l.product_qty::float, p.active, u.rounding::float
+          FROM mrp_bom_line l
+          JOIN product_product p ON p.id = l.product_id
+          JOIN uom_uom u ON u.id = l.product_uom_id
+         WHERE l.bom_id = ANY(%s)
+         ORDER BY l.bom_id, l.sequence, l.id
+    """, (batch_ids,))
+    line_rows = env.cr.fetchall()
+
+    # Variant groups of template BoMs with variant-specific lines:
+    # line_id -> indexes of the distinct per-variant line sets containing it
+    line_groups = {}
+    expanded_bom_ids = set()
+    if CHECK_VARIANT_DUPLICATES and 'duplicate' in ENABLED_RULES:
+        for bom_id, variant_sets in expand_variant_boms(batch_ids).items():
+            expanded_bom_ids.add(bom_id)
+            for g, (line_ids, variant_count) in enumerate(variant_sets):
+                for l in line_ids:
+                    line_groups.setdefault(l, set()).add(g)
+
+    to_remove = []
+    kept = None
+    current_bom = None
+    for line_id, bom_id, product_id, qty, product_active, rounding in line_rows:
+        if bom_id != current_bom:
+            current_bom = bom_id
+            kept = {'product_ids': set(), 'group_products': {}}
+
+        line = {
+            'id': line_id,
+            'bom_id': bom_id,
+            'product_id': product_id,
+            'product_qty': qty or 0.0,
+            'product_active': product_active,
+            'uom_rounding': rounding or 0.0,
+            # None = flat BoM, otherwise the variant groups getting this line
+            'variant_groups': line_groups.get(line_id, set()) if bom_id in expanded_bom_ids else None,
         }
+
+        # Single pass: the first rule that matches decides
+        hit = None
+        for code, label, func in active_rules:
+            if func(line, kept):
+                hit = code
+                break
+
+        if hit:
+            stats[hit] += 1
+            to_remove.append(line_id)
+            modified_bom_ids.add(bom_id)
+        elif line['variant_groups'] is None:
+            kept['product_ids'].add(product_id)
+        else:
+            for g in line['variant_groups']:
+                kept['group_products'].setdefault(g, set()).add(product_id)
+
+    if to_remove:
+        # One combined write for the whole batch
+        env['mrp.bom.line'].browse(to_remove).unlink()
+
+    # Commit to save progress and release locks
+    env.cr.commit()
+
+    # Real-time progress bus notification
+    progress = min(i + BATCH_SIZE, total_boms)
+    env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
+        'title': 'BOM Cleanup Progress',
+        'message': f'Processed {progress}/{total_boms} BOM(s)...',
+        'type': 'info',
+        'sticky': False
+    })
+
+rule_lines = "\n".join([f"- {label}: {stats[code]} removed" for code, label, func in active_rules])
+log(f"BOM cleanup engine finished on {total_boms} BOM(s):\n{rule_lines}", level='info')
+
+action = {
+    'type': 'ir.actions.client',
+    'tag': 'display_notification',
+    'params': {
+        'title': 'BOM Cleanup Complete',
+        'message': f"Cleaned {total_boms} BOM(s), {len(modified_bom_ids)} modified:\n{rule_lines}",
+        'type': 'success',
+        'sticky': True,
     }
+}
 
+## Single-Pass Rule Engine
+## Cached Per-Variant BoM Expansion
+## Real-time Batch Notifications via Bus
 ## Powered By HSx Tech
-## Ali 
+## Ali
@@ -1,29 +1,136 @@
 # Remove Archived Products from BOM Lines
 # Part of Odoo BOM Cleanup Tools - Powered by Hsx TECH
+# Model: Bill of Materials (mrp.bom), or Product (product.template / product.product) for automation
+# Action To Do: Execute Python Code
+#
+# Usage:
+# - Selection: select BOMs in the list view and run this action.
+# - Whole database (SCOPE = 'database'): run once, no selection needed, to clear
+#   the existing backlog with one SQL anti-join instead of a scan per BOM.
+# - Automated: create an Automation Rule on Product Variant (and/or Product),
+#   trigger "On Update" of Active, filter "Active is not set", with this script.
+#   When a product is archived its BOM lines are removed (or flagged) in the
+#   same transaction, looked up through an index on mrp_bom_line.product_id
+#   (created on the first run of either mode when the database has none).
 
-def remove_archived_products(self):
-    """
-    Server action to remove BOM lines containing archived products
-    Works on single or multiple BOMs
+# ── Configuration ────────────────────────────────────────────────────────────
+# 'selection' = selected BOMs only, 'database' = every BOM in the database
+SCOPE = 'selection'
+# 'remove' = delete the lines, 'flag' = only post a note on the affected BOMs
+ARCHIVED_ACTION = 'remove'
+# Lines unlinked per committed batch (selection / database scope)
+BATCH_SIZE = 1000
+# ─────────────────────────────────────────────────────────────────────────────
+
+if ARCHIVED_ACTION not in ('remove', 'flag'):
+    raise UserError("ARCHIVED_ACTION must be 'remove' or 'flag'.")
+
+def flag_boms(line_rows):
+    """Post one note per affected BOM listing its archived components."""
+    products_by_bom = {}
+    for line_id, bom_id, product_id in line_rows:
+        products_by_bom.setdefault(bom_id, set()).add(product_id)
+    all_products = set()
+    for product_ids in products_by_bom.values():
+        all_products.update(product_ids)
+    names = {p['id']: p['display_name'] for p in env['product.product'].with_context(active_test=False).browse(
+        list(all_products)).read(['display_name'])}
+    for bom in env['mrp.bom'].with_context(active_test=False).browse(list(products_by_bom.keys())):
+        product_list = "".join([f"<li>{names.get(p)}</li>" for p in sorted(products_by_bom[bom.id])])
+        bom.message_post(body=f"<p>⚠️ This BOM uses archived components:</p><ul>{product_list}</ul>")
+    return len(products_by_bom)
+
+def ensure_product_index():
+    """Make sure component lookups go through an index on mrp_bom_line.product_id."""
+    env.cr.execute("""
+        SELECT 1 FROM pg_indexes
+         WHERE tablename = 'mrp_bom_line' AND indexdef LIKE %s
+    """, ('%(product_id)',))
+    if not env.cr.fetchone():
+        env.cr.execute("CREATE INDEX IF NOT EXISTS hsx_mrp_bom_line_product_id_idx ON mrp_bom_line (product_id)")
+
+automation_model = records._name if records else None
+
+if automation_model in ('product.product', 'product.template'):
+    # ── Automated mode: only the products just archived ─────────────────────
+    if automation_model == 'product.template':
+        variant_ids = records.with_context(active_test=False).mapped('product_variant_ids').ids
+    else:
+        variant_ids = records.ids
+
+    ensure_product_index()
+
+    # The ORM flushes the pending archive before searching (index lookup on product_id)
+    archived_lines = env['mrp.bom.line'].with_context(active_test=False).search_read([
+        ('product_id', 'in', variant_ids),
+        ('product_id.active', '=', False),
+    ], ['bom_id', 'product_id'])
+    line_rows = [(l['id'], l['bom_id'][0], l['product_id'][0]) for l in archived_lines]
+
+    if line_rows:
+        if ARCHIVED_ACTION == 'remove':
+            # One bulk unlink, in the same transaction as the archive
+            env['mrp.bom.line'].browse([r[0] for r in line_rows]).unlink()
+            log(f"Removed {len(line_rows)} BOM line(s) of archived products {variant_ids}.", level='info')
+        else:
+            flagged = flag_boms(line_rows)
+            log(f"Flagged {flagged} BOM(s) using archived products {variant_ids}.", level='info')
+
+else:
+    # ── Selection / whole-database mode ─────────────────────────────────────
+    active_ids = env.context.get('active_ids', [])
+    if SCOPE != 'database' and not active_ids:
+        raise UserError("Please select at least one BOM, or set SCOPE = 'database'.")
+
+    ensure_product_index()
+
+    # One anti-join: lines whose component has no active product row
+    query = """
+        SELECT l.id, l.bom_id, l.product_id
+          FROM mrp_bom_line l
+         WHERE NOT EXISTS (
+                   SELECT 1 FROM product_product p
+                    WHERE p.id = l.product_id AND p.active
+               )
     """
-    boms = self if self else self.env['mrp.bom'].browse(self.env.context.get('active_ids'))
-    archived_count = 0
+    params = ()
+    if SCOPE != 'database':
+        query += " AND l.bom_id = ANY(%s)"
+        params = (list(active_ids),)
+    env.cr.execute(query + " ORDER BY l.id", params)
+    line_rows = env.cr.fetchall()
+
+    total_lines = len(line_rows)
+    bom_count = len(set(r[1] for r in line_rows))
+
+    if ARCHIVED_ACTION == 'flag':
+        flag_boms(line_rows)
+        message = f'Flagged {bom_count} BOM(s) using {total_lines} archived line(s)'
+    else:
+        line_ids = [r[0] for r in line_rows]
+        for i in range(0, total_lines, BATCH_SIZE):
+            env['mrp.bom.line'].browse(line_ids[i:i + BATCH_SIZE]).unlink()
 
-    for bom in boms:
-        archived_lines = bom.bom_line_ids.filtered(lambda l: not l.product_id.active)
-        if archived_lines:
-            archived_count += len(archived_lines)
-            bom.write({'bom_line_ids': [(3, l.id) for l in archived_lines]})
+            # Commit to save progress and release locks
+            env.cr.commit()
+            progress = min(i + BATCH_SIZE, total_lines)
+            env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
+                'title': 'Archived Products Cleanup',
+                'message': f'Removed {progress}/{total_lines} lines...',
+                'type': 'info',
+                'sticky': False
+            })
+        message = f'Removed {total_lines} archived lines from {bom_count} BOM(s)'
 
-    return {
+    action = {
         'type': 'ir.actions.client',
         'tag': 'display_notification',
         'params': {
-            'title': 'Archived Products Removed',
-            'message': f'Removed {archived_count} archived lines from {len(boms)} BOM(s)',
+            'title': 'Archived Products Removed' if ARCHIVED_ACTION == 'remove' else 'Archived Products Flagged',
+            'message': message,
             'type': 'success',
             'sticky': False,
         }
     }
 ## Powered By HSx Tech
-## Ali 
+## Ali
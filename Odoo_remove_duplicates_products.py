@@ -3,6 +3,16 @@
 
 # ── Configuration ────────────────────────────────────────────────────────────
 BATCH_SIZE = 50
+# SQL Mode: find every duplicate (bom_id, product_id) line with ONE window-function
+# query (first line by sequence/id is kept) and unlink them set-based per batch.
+# In both modes lines only count as duplicates when they also share the same
+# "Apply on Variants" values: variant-specific lines of one component are kept.
+USE_SQL_DETECTION = True
+# 'selection' = selected BOMs/lines only, 'database' = every BOM in the database
+# (SQL Mode only, no selection needed)
+SCOPE = 'selection'
+# Lines unlinked per batch in SQL Mode
+SQL_BATCH_SIZE = 1000
 # ─────────────────────────────────────────────────────────────────────────────
 
 # Detect selection context (Model and IDs)
@@ -18,7 +28,9 @@ if not active_ids:
         active_ids = records.ids
         active_model = records._name
 
-if not active_ids:
+database_scope = USE_SQL_DETECTION and SCOPE == 'database'
+
+if not active_ids and not database_scope:
     action = {
         'type': 'ir.actions.client',
         'tag': 'display_notification',
@@ -31,7 +43,9 @@ if not active_ids:
     }
 else:
     # Resolve to BOM records
-    if active_model == 'mrp.bom':
+    if database_scope:
+        boms = env['mrp.bom']
+    elif active_model == 'mrp.bom':
         boms = env['mrp.bom'].browse(active_ids)
     elif active_model == 'mrp.bom.line':
         lines = env['mrp.bom.line'].browse(active_ids)
@@ -44,37 +58,88 @@ else:
     duplicate_count = 0
     unique_bom_ids = set()
 
-    for i in range(0, total_boms, BATCH_SIZE):
-        batch = boms[i:i + BATCH_SIZE]
+    if USE_SQL_DETECTION:
+        # ROW_NUMBER per (bom_id, product_id, variant values) ordered like bom_line_ids
+        # (sequence, id): rank 1 is the line we keep, every rank > 1 is a duplicate.
+        query = """
+            SELECT id, bom_id FROM (
+                SELECT l.id, l.bom_id,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY l.bom_id, l.product_id, COALESCE(v.value_ids, '{{}}')
+                           ORDER BY l.sequence, l.id
+                       ) AS rn
+                  FROM mrp_bom_line l
+                  LEFT JOIN (
+                      SELECT mrp_bom_line_id,
+                             array_agg(product_template_attribute_value_id ORDER BY product_template_attribute_value_id) AS value_ids
+                        FROM mrp_bom_line_product_template_attribute_value_rel
+                       GROUP BY mrp_bom_line_id
+                  ) v ON v.mrp_bom_line_id = l.id
+                 {where}
+            ) ranked
+             WHERE rn > 1
+             ORDER BY bom_id, id
+        """
+        if database_scope:
+            env.cr.execute(query.format(where=''))
+            rows = env.cr.fetchall()
+            total_boms = env['mrp.bom'].with_context(active_test=False).search_count([])
+        else:
+            env.cr.execute(query.format(where='WHERE l.bom_id = ANY(%s)'), (boms.ids,))
+            rows = env.cr.fetchall()
+
+        duplicate_ids = [r[0] for r in rows]
+        unique_bom_ids.update(r[1] for r in rows)
+        total_dupes = len(duplicate_ids)
+
+        for i in range(0, total_dupes, SQL_BATCH_SIZE):
+            batch_ids = duplicate_ids[i:i + SQL_BATCH_SIZE]
+            # One set-based unlink for the whole batch
+            env['mrp.bom.line'].browse(batch_ids).unlink()
+            duplicate_count += len(batch_ids)
+
+            # Commit to save progress and release locks
+            env.cr.commit()
+
+            progress = min(i + SQL_BATCH_SIZE, total_dupes)
+            env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
+                'title': 'Duplicate Removal Progress',
+                'message': f'Removed {progress}/{total_dupes} duplicate line(s)...',
+                'type': 'info',
+                'sticky': False
+            })
+    else:
+        for i in range(0, total_boms, BATCH_SIZE):
+            batch = boms[i:i + BATCH_SIZE]
         
-        for bom in batch:
-            seen = set()
-            duplicates = []
-            # We use sorted line IDs to ensure consistent 'first occurrence' preservation
-            for line in bom.bom_line_ids:
-                pid = line.product_id.id
-                if pid in seen:
-                    duplicates.append(line.id)
-                else:
-                    seen.add(pid)
+            for bom in batch:
+                seen = set()
+                duplicates = []
+                # We use sorted line IDs to ensure consistent 'first occurrence' preservation
+                for line in bom.bom_line_ids:
+                    key = (line.product_id.id, tuple(sorted(line.bom_product_template_attribute_value_ids.ids)))
+                    if key in seen:
+                        duplicates.append(line.id)
+                    else:
+                        seen.add(key)
             
-            if duplicates:
-                duplicate_count += len(duplicates)
-                unique_bom_ids.add(bom.id)
-                # (3, ID) deletes the O2M record
-                bom.write({'bom_line_ids': [(3, d) for d in duplicates]})
+                if duplicates:
+                    duplicate_count += len(duplicates)
+                    unique_bom_ids.add(bom.id)
+                    # (3, ID) deletes the O2M record
+                    bom.write({'bom_line_ids': [(3, d) for d in duplicates]})
                 
-        # Commit to save progress and release locks
-        env.cr.commit()
+            # Commit to save progress and release locks
+            env.cr.commit()
         
-        # Real-time progress bus notification
-        progress = min(i + BATCH_SIZE, total_boms)
-        env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
-            'title': 'Duplicate Removal Progress',
-            'message': f'Processed {progress}/{total_boms} BOM(s)...',
-            'type': 'info',
-            'sticky': False
-        })
+            # Real-time progress bus notification
+            progress = min(i + BATCH_SIZE, total_boms)
+            env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
+                'title': 'Duplicate Removal Progress',
+                'message': f'Processed {progress}/{total_boms} BOM(s)...',
+                'type': 'info',
+                'sticky': False
+            })
 
     message = f'Removed {duplicate_count} duplicate lines from {total_boms} processed BOM(s).'
 
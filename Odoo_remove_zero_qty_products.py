@@ -1,21 +1,75 @@
-boms = env['mrp.bom'].browse(env.context.get('active_ids', []))
-removed_count = 0
+# Remove Zero Quantity Lines from BOM Lines
+# Part of Odoo BOM Cleanup Tools - Powered by Hsx TECH
+# Model: Bill of Materials (mrp.bom)
+# Action To Do: Execute Python Code
+#
+# Usage:
+# Select BOMs in the list view and run this action ("Select all" works too: when
+# the id list is truncated at the active_ids limit, the list's domain is used). With SCOPE = 'database' every
+# BOM is cleaned, no selection needed.
+# A line counts as zero when its quantity rounds to zero in its unit of measure
+# (abs(qty) < rounding / 2), so 0.0000001 Units is removed as well.
 
-for bom in boms:
-    zero_qty_lines = env['mrp.bom.line'].search([
-        ('bom_id', '=', bom.id),
-        ('product_qty', '=', 0)
-    ])
-    removed_count += len(zero_qty_lines)
-    zero_qty_lines.unlink()
+# ── Configuration ────────────────────────────────────────────────────────────
+# 'selection' = selected BOMs only, 'database' = every BOM in the database
+SCOPE = 'selection'
+# Lines unlinked per committed batch
+BATCH_SIZE = 1000
+# ─────────────────────────────────────────────────────────────────────────────
+
+bom_ids = None
+if SCOPE != 'database':
+    bom_ids = env.context.get('active_ids', [])
+    active_domain = env.context.get('active_domain')
+    if (active_domain is not None and env.context.get('active_model') == 'mrp.bom'
+            and len(bom_ids) >= env.context.get('active_ids_limit', 20000)):
+        # "Select all" beyond the id limit: the id list is truncated, use the domain
+        bom_ids = env['mrp.bom'].search(active_domain).ids
+    if not bom_ids:
+        raise UserError("Please select at least one BOM, or set SCOPE = 'database'.")
+
+# One query over mrp_bom_line with a UoM-rounding aware zero test
+query = """
+    SELECT l.id, l.bom_id
+      FROM mrp_bom_line l
+      JOIN uom_uom u ON u.id = l.product_uom_id
+     WHERE abs(l.product_qty) < u.rounding / 2
+"""
+params = ()
+if bom_ids is not None:
+    query += " AND l.bom_id = ANY(%s)"
+    params = (bom_ids,)
+env.cr.execute(query + " ORDER BY l.id", params)
+zero_rows = env.cr.fetchall()
+
+line_ids = [r[0] for r in zero_rows]
+removed_count = len(line_ids)
+bom_count = len(set(r[1] for r in zero_rows))
+
+for i in range(0, removed_count, BATCH_SIZE):
+    env['mrp.bom.line'].browse(line_ids[i:i + BATCH_SIZE]).unlink()
+
+    # Commit to save progress and release locks
+    env.cr.commit()
+    progress = min(i + BATCH_SIZE, removed_count)
+    env['bus.bus']._sendone(env.user.partner_id, 'simple_notification', {
+        'title': 'Zero Quantity Cleanup',
+        'message': f'Removed {progress}/{removed_count} lines...',
+        'type': 'info',
+        'sticky': False
+    })
+
+scope_label = 'the database' if bom_ids is None else f'{len(bom_ids)} selected BOM(s)'
 
 action = {
     'type': 'ir.actions.client',
     'tag': 'display_notification',
     'params': {
         'title': 'Zero Quantity Lines Removed',
-        'message': f'Removed {removed_count} zero-quantity line(s) from {len(boms)} BOM(s)',
+        'message': f'Removed {removed_count} zero-quantity line(s) from {bom_count} BOM(s) in {scope_label}',
         'type': 'success',
         'sticky': False,
     }
 }
+
+## Powered By HSx Tech - Ali Muzafar